@@ -1,7 +1,5 @@
 import streamlit as st
-import time
-from green_analyzer import GreenAnalyzerPro
-import pandas as pd
+from green_analyzer import get_analyzer
 
 # Page Config
 st.set_page_config(
@@ -11,6 +9,11 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+@st.cache_resource
+def load_analyzer():
+    # Streamlit reruns this script on every interaction; keep one analyzer for the process
+    return get_analyzer()
+
 # Custom CSS for Premium Look
 st.markdown("""
     <style>
@@ -94,13 +97,12 @@ else:
 col_btn, col_space = st.columns([1, 3])
 with col_btn:
     analyze_btn = st.button("🌱 Greenify Code", disabled=(not input_code.strip()))
+with col_space:
+    measure_fix = st.checkbox("⚖️ Measure the fix: run original and fixed code side by side (executes your code)")
 
 if analyze_btn:
     with st.spinner("Analyzing CO2 impact & Optimizing..."):
-        # Emulate processing time for effect
-        time.sleep(1.2)
-        
-        analyzer = GreenAnalyzerPro()
+        analyzer = load_analyzer()
         
         # 1. Hybrid Search: Table Lookup -> AI Fallback
         results = analyzer.analyze_and_fix(input_code)
@@ -110,14 +112,11 @@ if analyze_btn:
         # For this demo, we can try to run it if it's simple, or just show the static analysis.
         # We will wrap it in a safe try-except block in the analyzer.
         
-        # Define a wrapper to execute the user code for measurement
-        def user_code_wrapper():
-            exec(input_code, {'__builtins__': {}}, {}) # Restricted execution
-            
         # Only measure if it looks like safe runnable code (simplified check)
+        # The code runs in a sandbox worker process with a whitelist of harmless builtins (restricted execution)
         metrics = {}
         if "import os" not in input_code and "import sys" not in input_code:
-             metrics = analyzer.measure_efficiency(user_code_wrapper, timeout_sec=2)
+             metrics = analyzer.measure_efficiency(input_code, timeout_sec=2, restricted=True, trace_memory=True)
 
         
         if results:
@@ -138,11 +137,12 @@ if analyze_btn:
             st.markdown("---")
             st.markdown("#### ⚡ Efficiency Metrics (Baseline)")
             
-            m1, m2, m3 = st.columns(3)
+            m1, m2, m3, m4 = st.columns(4)
             
             # Use actual metrics if we captured them, otherwise show estimates based on rules
             duration_val = f"{metrics.get('duration_sec', 0):.4f}s" if metrics else "Estimated -25%"
             emissions_val = f"{metrics.get('emissions_kg', 0):.6f} kg" if metrics else "Low"
+            memory_val = f"{metrics['peak_alloc_kb']:,} KB" if metrics.get('peak_alloc_kb') is not None else "n/a"
             
             with m1:
                 st.markdown(f'<div class="metric-card"><h5>Current Duration</h5><h3 style="color:#FFC107">{duration_val}</h3></div>', unsafe_allow_html=True)
@@ -150,7 +150,33 @@ if analyze_btn:
                 st.markdown(f'<div class="metric-card"><h5>CO2 Emissions</h5><h3 style="color:#FF5722">{emissions_val}</h3></div>', unsafe_allow_html=True)
             with m3:
                 st.markdown(f'<div class="metric-card"><h5>AI Optimization Status</h5><h3 style="color:#00C853">Hybrid Active</h3></div>', unsafe_allow_html=True)
-                
+            with m4:
+                st.markdown(f'<div class="metric-card"><h5>Peak Memory</h5><h3 style="color:#29B6F6">{memory_val}</h3></div>', unsafe_allow_html=True)
+
+            if measure_fix:
+                st.markdown("#### ⚖️ Measured A/B: Original vs Fixed")
+                with st.spinner("Running original and fixed code side by side..."):
+                    ab = analyzer.compare_fix(input_code, timeout_sec=5, restricted=True)
+                if "error" in ab:
+                    st.info(f"A/B comparison unavailable: {ab['error']}")
+                else:
+                    st.code(ab["fixed_code"], language="python")
+                    st.caption("Fixes applied: " + ", ".join(f"{rule_id} ×{n}" for rule_id, n in ab["applied"].items()))
+                    gain = ab["speedup"]
+                    rss_delta = ab["peak_rss_delta_kb"]
+                    a1, a2, a3 = st.columns(3)
+                    with a1:
+                        st.markdown(f'<div class="metric-card"><h5>Measured Speedup</h5><h3 style="color:#00C853">{gain["ratio"]:.2f}×</h3>'
+                                    f'<small>95% CI {gain["ci_low"]:.2f}–{gain["ci_high"]:.2f}, {ab["rounds"]} runs each</small></div>', unsafe_allow_html=True)
+                    with a2:
+                        alloc_delta = ab["peak_alloc_delta_kb"]
+                        alloc_val = f"{alloc_delta:+,} KB" if alloc_delta is not None else "n/a"
+                        rss_val = f"{rss_delta:+,.0f} KB" if rss_delta is not None else "n/a"
+                        st.markdown(f'<div class="metric-card"><h5>Peak Memory Δ</h5><h3 style="color:#FFC107">{alloc_val}</h3>'
+                                    f'<small>RSS high-water {rss_val}</small></div>', unsafe_allow_html=True)
+                    with a3:
+                        st.markdown(f'<div class="metric-card"><h5>CO2 Saved per Run</h5><h3 style="color:#FF5722">{ab["co2_saved_kg_per_run"]:.3g} kg</h3></div>', unsafe_allow_html=True)
+
         else:
             st.warning("No specific 'Dirty' patterns found in the Lookup Table. Sending to AI Model (Simulation)...")
             st.info("🤖 AI Client suggests: 'Code looks clean! Consider profiling logic complexity.'")
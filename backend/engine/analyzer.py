@@ -1,60 +1,288 @@
 import ast
+import json
+import math
+import operator
+import os
+import time
+from collections import Counter
+from .cache import cache_from_env
+from .metrics import timed_rules
+from .rules import DIRTY_PATTERNS, LOOP_NODES, MEMORY_RULES, RULES, RULESET_VERSION, SUGGESTIONS
 
-# Rough estimation values (extendable with real profiling)
-CPU_COST_PER_OP = 0.00002  # Wh per operation
 CO2_PER_WH = 0.475  # grams (global avg)
 
-DIRTY_PATTERNS = {
-    'for_range_len': 'Use direct iteration instead of range(len(x))',
-    'list_append_loop': 'Use list comprehensions instead of append in loops'
+# Per-node-type costs in nanoseconds, fitted on this machine by `python -m backend.engine.calibration`
+PROFILE_DIR = os.path.join(os.path.dirname(__file__), 'profiles')
+
+
+def load_profile(path=None):
+    path = path or os.environ.get('GREENCODE_COST_PROFILE') or os.path.join(PROFILE_DIR, 'default.json')
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+PROFILE = load_profile()
+
+# Results depend on the rules and on the cost profile that priced them
+MODEL_VERSION = f"{RULESET_VERSION}:{PROFILE['version']}"
+
+# Only statements and expressions do work at runtime; contexts and operators belong to their parent
+COUNTED_NODES = (ast.stmt, ast.expr)
+COMPREHENSION_NODES = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+MAX_MULTIPLIER = 1e15  # deep nesting of huge ranges would otherwise overflow to inf
+
+# Bytes per element of a collection built from new objects, measured with tracemalloc on
+# CPython 3.11: the container's slot plus a fresh int (two for dicts)
+ELEMENT_BYTES = {
+    'ListComp': 40, 'SetComp': 70, 'DictComp': 108,
+    'list': 40, 'tuple': 40, 'sorted': 40, 'set': 70, 'frozenset': 70,
+}
+LARGE_ALLOC_BYTES = 1 << 20  # statically sized allocations past this are reported
+ALLOC_NODES = (ast.Call, ast.BinOp)
+
+_INT_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.FloorDiv: operator.floordiv,
+    ast.Pow: operator.pow,
 }
 
+# Shared by every caller of analyze_code, keyed by source hash and MODEL_VERSION
+RESULT_CACHE = cache_from_env()
+
+
+class EnergyVisitor(ast.NodeVisitor):
+    """Counts how often each node type runs and runs every registered rule in one pass over the tree.
+
+    A node inside loops is counted once per iteration of all enclosing loops. Loops over
+    a literal range() or container have a known trip count; any other loop is assumed
+    to run default_trips times. Function bodies are counted as if called once.
+
+    peak_bytes is the largest collection the code builds at once, times the copies of
+    it kept alive by enclosing comprehensions.
+    """
+
+    def __init__(self, default_trips=PROFILE['default_trips'], rules=RULES):
+        self.default_trips = default_trips
+        self.rules = rules
+        self.counts = Counter()
+        self.multiplier = 1
+        self.retained = 1
+        self.retained_static = True
+        self.peak_bytes = 0
+        self.loop_depth = 0
+        self.findings = []
+        self.list_names = set()
+        self.str_names = set()
+
+    def visit(self, node):
+        node_type = type(node)
+        for check in self.rules.get(node_type, ()):
+            check(node, self)
+        if node_type in LOOP_NODES:
+            self.loop_depth += 1
+            self._visit_loop(node)
+            self.loop_depth -= 1
+        elif node_type in COMPREHENSION_NODES:
+            self._visit_comprehension(node)
+        else:
+            if node_type in ALLOC_NODES:
+                size = allocation_bytes(node, self.default_trips)
+                if size is not None:
+                    self._allocate(node, *size)
+            if isinstance(node, COUNTED_NODES):
+                self.counts[node_type.__name__] += self.multiplier
+            self.generic_visit(node)
+
+    def _visit_loop(self, node):
+        outer = self.multiplier
+        if isinstance(node, ast.For):
+            self.visit(node.iter)
+            trips = loop_trips(node.iter, self.default_trips)
+            head = node.target
+        else:
+            trips = self.default_trips
+            head = node.test
+        self.multiplier = min(outer * trips, MAX_MULTIPLIER)
+        self.counts[type(node).__name__] += self.multiplier  # the loop's own per-iteration overhead
+        self.visit(head)
+        for stmt in node.body:
+            self.visit(stmt)
+        self.multiplier = outer
+        for stmt in node.orelse:
+            self.visit(stmt)
+
+    def _visit_comprehension(self, node):
+        outer, retained, retained_static = self.multiplier, self.retained, self.retained_static
+        self.counts[type(node).__name__] += outer
+        elements, static = 1, True
+        for generator in node.generators:
+            self.visit(generator.iter)
+            trips = loop_trips(generator.iter, None)
+            if trips is None:
+                trips, static = self.default_trips, False
+            elements = min(elements * trips, MAX_MULTIPLIER)
+            self.multiplier = min(self.multiplier * trips, MAX_MULTIPLIER)
+            self.counts['comprehension'] += self.multiplier
+            self.visit(generator.target)
+            for condition in generator.ifs:
+                self.visit(condition)
+        if not isinstance(node, ast.GeneratorExp):
+            self._allocate(node, elements * ELEMENT_BYTES[type(node).__name__], static)
+            # The collection keeps whatever each of its elements allocates alive
+            self.retained = min(retained * elements, MAX_MULTIPLIER)
+            self.retained_static = retained_static and static
+        for child in (node.key, node.value) if isinstance(node, ast.DictComp) else (node.elt,):
+            self.visit(child)
+        self.multiplier, self.retained, self.retained_static = outer, retained, retained_static
+
+    def _allocate(self, node, nbytes, static):
+        nbytes = min(nbytes * self.retained, MAX_MULTIPLIER)
+        self.peak_bytes = max(self.peak_bytes, nbytes)
+        if static and self.retained_static and nbytes >= LARGE_ALLOC_BYTES:
+            self.report('large_alloc', node)
+
+    def report(self, rule_id, node):
+        self.findings.append({
+            'id': rule_id,
+            'line': node.lineno,
+            'col': node.col_offset,
+            'message': DIRTY_PATTERNS[rule_id],
+        })
+
+
+def loop_trips(node, default):
+    """Iteration count of a loop over node when it is static, else default."""
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)) and not any(isinstance(e, ast.Starred) for e in node.elts):
+        return len(node.elts)
+    if isinstance(node, ast.Dict) and None not in node.keys:
+        return len(node.keys)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (str, bytes)):
+        return len(node.value)
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'range'
+            and 1 <= len(node.args) <= 3 and not node.keywords):
+        args = [_const_int(arg) for arg in node.args]
+        if None not in args:
+            try:
+                return len(range(*args))
+            except ValueError:  # range() step of 0
+                return 0
+            except OverflowError:
+                return MAX_MULTIPLIER
+    return default
+
+
+def allocation_bytes(node, default):
+    """(bytes, static) of the collection a call like list(range(n)) or a repetition like
+    [0] * n builds, or None. static is False when the size is a guess from default trips.
+    """
+    if isinstance(node, ast.Call):
+        if (isinstance(node.func, ast.Name) and node.func.id in ELEMENT_BYTES
+                and len(node.args) == 1 and not node.keywords):
+            trips = loop_trips(node.args[0], None)
+            if trips is None:
+                return default * ELEMENT_BYTES[node.func.id], False
+            return trips * ELEMENT_BYTES[node.func.id], True
+        return None
+    if isinstance(node.op, ast.Mult):
+        for seq, times in ((node.left, node.right), (node.right, node.left)):
+            count = _const_int(times)
+            if count is None:
+                continue
+            # Repetition copies references, so only the new slots or characters count
+            if isinstance(seq, (ast.List, ast.Tuple)) and not any(isinstance(e, ast.Starred) for e in seq.elts):
+                return max(count, 0) * len(seq.elts) * 8, True
+            if isinstance(seq, ast.Constant) and isinstance(seq.value, (str, bytes)):
+                return max(count, 0) * len(seq.value), True
+    return None
+
+
+def _const_int(node):
+    if isinstance(node, ast.Constant) and type(node.value) is int:
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = _const_int(node.operand)
+        return None if value is None else -value
+    if isinstance(node, ast.BinOp) and type(node.op) in _INT_OPS:
+        left, right = _const_int(node.left), _const_int(node.right)
+        if left is None or right is None:
+            return None
+        if isinstance(node.op, ast.Pow) and not 0 <= right <= 64:
+            return None
+        if isinstance(node.op, ast.FloorDiv) and right == 0:
+            return None
+        return _INT_OPS[type(node.op)](left, right)
+    return None
+
+
+def estimate_ns(counts, profile=PROFILE):
+    """Estimated runtime of the counted nodes, priced by the profile."""
+    costs = profile['costs_ns']
+    default = profile['default_cost_ns']
+    return sum(costs.get(name, default) * n for name, n in counts.items())
+
 
 def analyze_code(code: str):
+    return RESULT_CACHE.get_or_compute(code, MODEL_VERSION, 'analyze_code', _analyze)
+
+
+def _analyze(code: str, stages=None, rule_ns=None):
+    """Uncached analysis. Fills stages with seconds per stage and, when given, rule_ns with nanoseconds per rule check."""
+    start = time.perf_counter()
     try:
         tree = ast.parse(code)
     except SyntaxError as e:
-        return {
-            'error': f'Syntax error in code: {str(e)}',
-            'energy': 0,
-            'co2': 0,
-            'score': 0,
-            'suggestions': ['Please fix syntax errors before analysis']
-        }
-
-    operations = 0
-    suggestions = []
-
-    for node in ast.walk(tree):
-        if isinstance(node, (ast.For, ast.While)):
-            operations += 500
-            suggestions.append('Consider minimizing loops or using vectorized operations (e.g., NumPy)')
-
-        if isinstance(node, ast.Call):
-            operations += 50
-            # Check for range(len())
-            if isinstance(node.func, ast.Name) and node.func.id == 'range':
-                if len(node.args) == 1 and isinstance(node.args[0], ast.Call):
-                    if isinstance(node.args[0].func, ast.Name) and node.args[0].func.id == 'len':
-                        suggestions.append(DIRTY_PATTERNS['for_range_len'])
-
-        if isinstance(node, ast.ListComp):
-            operations += 200 # Comprehensions are generally more efficient but still take work
-        
-        # Detect nested loops
-        if isinstance(node, (ast.For, ast.While)):
-            for child in ast.walk(node):
-                if child != node and isinstance(child, (ast.For, ast.While)):
-                    suggestions.append('Detected nested loops. This can exponentially increase energy consumption.')
-
-    energy = round(operations * CPU_COST_PER_OP, 4)
-    co2 = round(energy * CO2_PER_WH, 4)
-
-    score = max(100 - int(operations / 50), 30)
+        return syntax_error_result(e)
+    parsed = time.perf_counter()
+
+    visitor = EnergyVisitor(rules=RULES if rule_ns is None else timed_rules(rule_ns))
+    visitor.visit(tree)
+    walked = time.perf_counter()
+    result = build_result(visitor.counts, visitor.findings, visitor.peak_bytes)
+    if stages is not None:
+        stages.update(parse=parsed - start, traversal=walked - parsed, scoring=time.perf_counter() - walked)
+    return result
+
+
+def syntax_error_result(error):
+    return {
+        'error': f'Syntax error in code: {str(error)}',
+        'energy': 0,
+        'co2': 0,
+        'score': 0,
+        'estimated_peak_bytes': 0,
+        'suggestions': ['Please fix syntax errors before analysis']
+    }
+
+
+def build_result(counts, findings, peak_bytes=0):
+    """The analyze_code response for the given node counts, rule findings and peak allocation."""
+    runtime_ns = estimate_ns(counts)
+
+    energy = runtime_ns * 1e-9 * PROFILE['watts'] / 3600
+    co2 = energy * CO2_PER_WH
+
+    # 100 up to a microsecond, 10 points off for every 10x slower
+    energy_score = max(100 - int(10 * math.log10(max(runtime_ns, 1000) / 1000)), 30)
+    # 100 up to a megabyte, 10 points off for every 10x more
+    memory_score = max(100 - int(10 * math.log10(max(peak_bytes, 1 << 20) / (1 << 20))), 30)
 
     return {
-        'energy': energy,
-        'co2': co2,
-        'score': score,
-        'suggestions': list(set(suggestions))
+        'energy': _round_sig(energy),
+        'co2': _round_sig(co2),
+        'score': min(energy_score, memory_score),
+        'energy_score': energy_score,
+        'memory_score': memory_score,
+        'estimated_ns': round(runtime_ns),
+        'estimated_peak_bytes': round(peak_bytes),
+        'cost_profile': PROFILE['version'],
+        'memory_findings': sorted({f['id'] for f in findings if f['id'] in MEMORY_RULES}),
+        'suggestions': list({SUGGESTIONS[f['id']] for f in findings if f['id'] in SUGGESTIONS}),
+        'findings': sorted(findings, key=lambda f: (f['line'], f['col'])),
     }
+
+
+def _round_sig(value, digits=4):
+    # Energy per snippet spans many orders of magnitude, so keep significant digits, not decimals
+    return float(f'{value:.{digits}g}')
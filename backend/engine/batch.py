@@ -0,0 +1,157 @@
+import io
+import json
+import os
+import tarfile
+import zipfile
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from .analyzer import MODEL_VERSION, RESULT_CACHE, _analyze
+
+MAX_FILE_BYTES = 2 * 1024 * 1024  # larger files are reported, not analyzed
+MAX_ARCHIVE_BYTES = 256 * 1024 * 1024  # uncompressed, guards against archive bombs
+WORKERS = os.cpu_count() or 1
+
+_pool = None
+
+
+def get_pool():
+    """Process pool sized to the machine, created on first use and shared by all requests."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=WORKERS)
+    return _pool
+
+
+def iter_archive(data: bytes):
+    """Yields (path, code) for every .py file in a zip or tar archive (any compression).
+
+    code is None for files over MAX_FILE_BYTES. Raises ValueError for anything that is
+    not a readable archive or expands past MAX_ARCHIVE_BYTES.
+    """
+    total = 0
+    members = _archive_members(data)
+    while True:
+        try:
+            path, size, read = next(members)
+            if not path.endswith('.py'):
+                continue
+            if size > MAX_FILE_BYTES:
+                yield path, None
+                continue
+            total += size
+            if total > MAX_ARCHIVE_BYTES:
+                raise ValueError(f'Archive expands past {MAX_ARCHIVE_BYTES} bytes')
+            code = read().decode('utf-8', errors='replace')
+        except StopIteration:
+            return
+        except (zipfile.BadZipFile, zlib.error, EOFError, tarfile.TarError) as e:
+            # A corrupt member (bad CRC, truncated stream) makes the whole archive unreadable
+            raise ValueError(f'Corrupt archive: {e}') from None
+        yield path, code
+
+
+def _archive_members(data):
+    buffer = io.BytesIO(data)
+    if zipfile.is_zipfile(buffer):
+        archive = zipfile.ZipFile(buffer)
+        for info in archive.infolist():
+            if not info.is_dir():
+                yield _clean_path(info.filename), info.file_size, lambda info=info: archive.read(info)
+        return
+    buffer.seek(0)
+    try:
+        archive = tarfile.open(fileobj=buffer, mode='r:*')
+    except tarfile.TarError:
+        raise ValueError('Expected a zip or tar archive')
+    for member in archive:
+        if member.isfile():
+            yield _clean_path(member.name), member.size, lambda member=member: archive.extractfile(member).read()
+
+
+def _clean_path(path):
+    while path.startswith('./'):
+        path = path[2:]
+    return path.lstrip('/')
+
+
+def _cache_key(code):
+    return RESULT_CACHE.key(code, MODEL_VERSION, 'analyze_code')
+
+
+def _file_fields(result, path, code):
+    result['path'] = path
+    result['lines'] = code.count('\n') + 1
+    return result
+
+
+def split_cached(files):
+    """Returns (results already in RESULT_CACHE, (path, code) pairs still to analyze).
+
+    Runs in the parent: the cache lives there, and a forked worker's copy (or its
+    inherited SQLite connection) must not be used.
+    """
+    cached, missing = [], []
+    for path, code in files:
+        text = RESULT_CACHE.get(_cache_key(code)) if code is not None else None
+        if text is None:
+            missing.append((path, code))
+        else:
+            cached.append(_file_fields(json.loads(text), path, code))
+    return cached, missing
+
+
+def analyze_files(files):
+    """Analyzes a chunk of (path, code) pairs uncached. Runs inside the process pool.
+
+    Returns (result, key) pairs for cache_results; key is None for files that were not
+    analyzed.
+    """
+    results = []
+    for path, code in files:
+        if code is None:
+            results.append(({'path': path, 'error': f'File larger than {MAX_FILE_BYTES} bytes'}, None))
+            continue
+        try:
+            result, key = _analyze(code), _cache_key(code)
+        except (ValueError, RecursionError, MemoryError) as e:
+            # null bytes, or nesting too deep for the parser
+            result, key = {'error': f'Could not analyze file: {e}'}, None
+        results.append((_file_fields(result, path, code), key))
+    return results
+
+
+def cache_results(pairs):
+    """Stores the (result, key) pairs from analyze_files in RESULT_CACHE and returns the results. Runs in the parent."""
+    results = []
+    for result, key in pairs:
+        if key is not None:
+            RESULT_CACHE.put(key, json.dumps({field: value for field, value in result.items() if field not in ('path', 'lines')}))
+        results.append(result)
+    return results
+
+
+def chunked(files):
+    """Splits files into chunks big enough to amortize inter-process overhead."""
+    size = max(1, min(32, len(files) // (WORKERS * 4)))
+    return [files[i:i + size] for i in range(0, len(files), size)]
+
+
+def summarize(results):
+    """Project-level totals. The score is the mean file score weighted by line count."""
+    analyzed = [r for r in results if 'error' not in r]
+    lines = sum(r['lines'] for r in analyzed)
+    findings = Counter(f['id'] for r in analyzed for f in r.get('findings', []))
+    return {
+        'files': len(results),
+        'analyzed': len(analyzed),
+        'errors': len(results) - len(analyzed),
+        'lines': lines,
+        'energy': round(sum(r['energy'] for r in analyzed), 4),
+        'co2': round(sum(r['co2'] for r in analyzed), 4),
+        'estimated_ns': sum(r['estimated_ns'] for r in analyzed),
+        'score': round(sum(r['score'] * r['lines'] for r in analyzed) / lines) if lines else 0,
+        'estimated_peak_bytes': max((r['estimated_peak_bytes'] for r in analyzed), default=0),
+        'top_findings': dict(findings.most_common(10)),
+    }
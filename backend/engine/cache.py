@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """Content-addressed cache for analysis results.
+
+    Entries are keyed by a hash of the source code and the version of the rule set
+    that produced them, evicted least-recently-used once the cache holds more than
+    max_entries results or max_bytes of serialized JSON, and expire after ttl
+    seconds. With db_path set, results are also written to a SQLite file so they
+    survive restarts.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=3600, db_path=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (stored_at, json text)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, stored_at REAL)')
+            if ttl is not None:
+                self._db.execute('DELETE FROM results WHERE stored_at < ?', (time.time() - ttl,))
+            self._db.commit()
+
+    @property
+    def persistent(self):
+        """True when lookups and stores also hit SQLite, so they block on disk."""
+        return self._db is not None
+
+    @staticmethod
+    def key(source, version, namespace=''):
+        digest = hashlib.sha256(f'{namespace}\0{version}\0'.encode())
+        digest.update(source.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def get_or_compute(self, source, version, namespace, compute):
+        """Returns a fresh copy of the cached result, calling compute(source) on a miss."""
+        key = self.key(source, version, namespace)
+        text = self.get(key)
+        if text is None:
+            text = json.dumps(compute(source))
+            self.put(key, text)
+        return json.loads(text)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self.ttl is None or now - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key)
+            if self._db is not None:
+                row = self._db.execute('SELECT value, stored_at FROM results WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    if self.ttl is None or now - row[1] < self.ttl:
+                        self.disk_hits += 1
+                        self._insert(key, row[0], row[1])
+                        return row[0]
+                    self._db.execute('DELETE FROM results WHERE key = ?', (key,))
+                    self._db.commit()
+            self.misses += 1
+            return None
+
+    def put(self, key, text):
+        now = time.time()
+        with self._lock:
+            self._insert(key, text, now)
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)', (key, text, now))
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute('DELETE FROM results')
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0,
+            }
+
+    def _insert(self, key, text, stored_at):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (stored_at, text)
+        self._bytes += len(text)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, text = self._entries.pop(key)
+        self._bytes -= len(text)
+
+
+def cache_from_env():
+    """Builds a ResultCache configured by the GREENCODE_CACHE_* environment variables."""
+    ttl = os.environ.get('GREENCODE_CACHE_TTL', '3600')
+    return ResultCache(
+        max_entries=int(os.environ.get('GREENCODE_CACHE_ENTRIES', '1024')),
+        max_bytes=int(os.environ.get('GREENCODE_CACHE_BYTES', str(64 * 1024 * 1024))),
+        ttl=float(ttl) if ttl else None,
+        db_path=os.environ.get('GREENCODE_CACHE_DB') or None,
+    )
@@ -0,0 +1,166 @@
+"""Fits the per-node-type costs used by analyze_code to timings taken on this host.
+
+Run from the repository root, where the benchmark harness lives:
+
+    python -m backend.engine.calibration --output backend/engine/profiles/default.json
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import platform
+import statistics
+import sys
+import textwrap
+import time
+
+from .analyzer import PROFILE_DIR, EnergyVisitor, estimate_ns
+
+PROFILE_FORMAT = 1
+
+# Each snippet exercises a few constructs on top of a loop whose trip count the visitor
+# can see. Bodies run inside a function, so names are locals as in most real code.
+# 'trips' is the iteration count of any while loop in the snippet. 'setup' runs at module
+# level before the body is timed and is not counted, so the functions it defines price
+# the calls to them, frame and all, into Call.
+CORPUS = [
+    {'id': 'for_pass', 'body': 'for i in range(2000):\n    pass'},
+    {'id': 'for_nested', 'body': 'for i in range(50):\n    for j in range(40):\n        pass'},
+    {'id': 'assign', 'body': 'for i in range(2000):\n    x = i'},
+    {'id': 'aug_assign', 'body': 'x = 0\nfor i in range(2000):\n    x += i'},
+    {'id': 'expr', 'body': 'for i in range(2000):\n    i'},
+    {'id': 'constant', 'body': 'for i in range(2000):\n    x = 1'},
+    {'id': 'binop', 'body': 'for i in range(2000):\n    x = i + 1'},
+    {'id': 'binop_chain', 'body': 'for i in range(2000):\n    x = i * 2 - i // 3 + 1'},
+    {'id': 'pow', 'body': 'for i in range(2000):\n    x = i ** 2'},
+    {'id': 'compare', 'body': 'for i in range(2000):\n    x = i < 1000'},
+    {'id': 'if', 'body': 'for i in range(2000):\n    if i < 1000:\n        pass'},
+    {'id': 'if_else', 'body': 'x = 0\nfor i in range(2000):\n    if i < 1000:\n        x = 1\n    else:\n        x = 2'},
+    {'id': 'boolop', 'body': 'for i in range(2000):\n    x = i and 1'},
+    {'id': 'unaryop', 'body': 'for i in range(2000):\n    x = -i'},
+    {'id': 'subscript', 'body': 'data = [0] * 2000\nfor i in range(2000):\n    x = data[i]'},
+    {'id': 'store_subscript', 'body': 'data = [0] * 2000\nfor i in range(2000):\n    data[i] = i'},
+    {'id': 'attribute', 'body': "s = 'a'\nfor i in range(2000):\n    x = s.upper"},
+    {'id': 'method_call', 'body': 'data = []\nfor i in range(2000):\n    data.append(i)'},
+    {'id': 'builtin_call', 'body': 'data = [0] * 10\nfor i in range(2000):\n    x = len(data)'},
+    {'id': 'str_call', 'body': 'for i in range(2000):\n    x = str(i)'},
+    {'id': 'fstring', 'body': "for i in range(2000):\n    x = f'{i}'"},
+    {'id': 'list', 'body': 'for i in range(2000):\n    x = [i, i, i]'},
+    {'id': 'tuple', 'body': 'for i in range(2000):\n    x = (i, i, i)'},
+    {'id': 'dict', 'body': 'for i in range(2000):\n    x = {i: i}'},
+    {'id': 'set', 'body': 'for i in range(2000):\n    x = {i, i}'},
+    {'id': 'tuple_unpack', 'body': 'a = b = 0\nfor i in range(2000):\n    a, b = b, a'},
+    {'id': 'try', 'body': 'for i in range(2000):\n    try:\n        x = i\n    except ValueError:\n        pass'},
+    {'id': 'import', 'body': 'for i in range(2000):\n    import math'},
+    {'id': 'while', 'body': 'i = 0\nwhile i < 2000:\n    i += 1', 'trips': 2000},
+    {'id': 'list_comp', 'body': 'x = [i for i in range(2000)]'},
+    {'id': 'list_comp_expr', 'body': 'x = [i * 2 for i in range(2000)]'},
+    {'id': 'set_comp', 'body': 'x = {i for i in range(2000)}'},
+    {'id': 'dict_comp', 'body': 'x = {i: i for i in range(2000)}'},
+    {'id': 'generator', 'body': 'x = sum(i for i in range(2000))'},
+    {'id': 'many_comps', 'body': 'for i in range(200):\n    x = [j for j in range(5)]'},
+    {'id': 'many_set_comps', 'body': 'for i in range(200):\n    x = {j for j in range(5)}'},
+    {'id': 'many_dict_comps', 'body': 'for i in range(200):\n    x = {j: j for j in range(5)}'},
+    {'id': 'many_generators', 'body': 'for i in range(200):\n    x = sum(j for j in range(5))'},
+    {'id': 'lambda', 'body': 'for i in range(2000):\n    f = lambda: i'},
+    {'id': 'user_call', 'setup': 'def f(x):\n    return x', 'body': 'for i in range(2000):\n    x = f(i)'},
+    {'id': 'user_call_args', 'setup': 'def f(x, y, z):\n    return x', 'body': 'for i in range(2000):\n    x = f(i, i, i)'},
+    {'id': 'user_call_stmt', 'setup': 'def f():\n    pass', 'body': 'for i in range(2000):\n    f()'},
+    {'id': 'user_method_call', 'setup': 'class C:\n    def m(self, x):\n        return x\nc = C()',
+     'body': 'for i in range(2000):\n    x = c.m(i)'},
+    {'id': 'if_taken', 'body': 'x = 0\nfor i in range(2000):\n    if i:\n        x = i'},
+    {'id': 'if_elif', 'body': 'x = 0\nfor i in range(2000):\n    if i < 500:\n        x = 1\n    elif i < 1000:\n        x = 2\n    else:\n        x = 3'},
+    {'id': 'if_exp', 'body': 'for i in range(2000):\n    x = 1 if i < 1000 else 2'},
+]
+
+
+def count_nodes(body, trips=1):
+    visitor = EnergyVisitor(default_trips=trips)
+    visitor.visit(ast.parse(body))
+    return visitor.counts
+
+
+def time_snippet(body, repeat, min_time, setup=''):
+    # The benchmark harness lives at the repository root and is not shipped with the backend
+    from benchmark import Timer
+    setup = setup + '\ndef snippet():\n' + textwrap.indent(body, '    ')
+    samples = Timer('snippet()', setup, repeat=repeat, min_time=min_time).run()
+    return statistics.median(samples['wall_ns'])
+
+
+def fit_costs(matrix, targets, sweeps=3000, floor=0.0):
+    """Least squares on relative error with every cost at least floor, by cyclic coordinate descent.
+
+    Every row is scaled by its target so a 50 µs snippet weighs as much as a 5 ms one.
+    The floor keeps node types the corpus cannot separate from their neighbours (an If
+    always comes with its Compare) from being priced as free.
+    """
+    rows = [[value / target for value in row] for row, target in zip(matrix, targets)]
+    size = len(rows[0])
+    gram = [[sum(row[i] * row[j] for row in rows) for j in range(size)] for i in range(size)]
+    rhs = [sum(row[i] for row in rows) for i in range(size)]
+    costs = [floor] * size
+    for _ in range(sweeps):
+        for i in range(size):
+            if gram[i][i]:
+                gradient = sum(g * c for g, c in zip(gram[i], costs)) - rhs[i]
+                costs[i] = max(floor, costs[i] - gradient / gram[i][i])
+    return costs
+
+
+def calibrate(repeat=15, min_time=0.01, watts=15.0, default_trips=100, floor_ns=1.0, log=None):
+    counts, timings = [], []
+    for entry in CORPUS:
+        counts.append(count_nodes(entry['body'], entry.get('trips', 1)))
+        timings.append(time_snippet(entry['body'], repeat, min_time, entry.get('setup', '')))
+    names = sorted(set().union(*counts))
+    fitted = fit_costs([[c.get(name, 0) for name in names] for c in counts], timings, floor=floor_ns)
+    costs = {name: round(cost, 3) for name, cost in zip(names, fitted)}
+    digest = hashlib.sha256(json.dumps(costs, sort_keys=True).encode()).hexdigest()[:8]
+    profile = {
+        'format': PROFILE_FORMAT,
+        'version': '{}-{}{}.{}-{}-{}'.format(
+            time.strftime('%Y%m%d'), platform.python_implementation().lower(),
+            sys.version_info[0], sys.version_info[1], platform.machine() or 'unknown', digest,
+        ),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'watts': watts,
+        'default_trips': default_trips,
+        'floor_ns': floor_ns,
+        'default_cost_ns': round(statistics.median(costs.values()), 3),
+        'costs_ns': costs,
+    }
+    errors = [abs(estimate_ns(c, profile) / t - 1) for c, t in zip(counts, timings)]
+    if log:
+        for entry, timing, error in zip(CORPUS, timings, errors):
+            log(f"{entry['id']:<16} {timing:>12.0f} ns  fit error {error:6.1%}")
+    profile['fit'] = {
+        'snippets': len(CORPUS),
+        'median_relative_error': round(statistics.median(errors), 4),
+        'max_relative_error': round(max(errors), 4),
+    }
+    return profile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit the analyzer cost model to this host.')
+    parser.add_argument('--output', default=os.path.join(PROFILE_DIR, 'default.json'))
+    parser.add_argument('--repeat', type=int, default=15)
+    parser.add_argument('--min-time', type=float, default=0.01)
+    parser.add_argument('--watts', type=float, default=15.0, help='average CPU power drawn while running Python code')
+    parser.add_argument('--default-trips', type=int, default=100, help='assumed iterations of a loop with unknown bounds')
+    parser.add_argument('--floor-ns', type=float, default=1.0, help='lowest cost of any node type, about one bytecode dispatch')
+    args = parser.parse_args(argv)
+
+    profile = calibrate(args.repeat, args.min_time, args.watts, args.default_trips, args.floor_ns, log=print)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, indent=2)
+        f.write('\n')
+    print(f"Wrote {args.output} (median error {profile['fit']['median_relative_error']:.1%}, "
+          f"max {profile['fit']['max_relative_error']:.1%})")
+
+
+if __name__ == '__main__':
+    main()
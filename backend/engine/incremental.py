@@ -0,0 +1,266 @@
+import ast
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+
+from .analyzer import EnergyVisitor, build_result, syntax_error_result
+from .rules import DIRTY_PATTERNS, is_swap
+
+_EMPTY_STATE = (frozenset(), frozenset())
+
+
+class VersionMismatch(Exception):
+    """The client's edits were made against a different version than the session holds."""
+
+
+class _Block:
+    """A run of whole lines holding one or more top-level statements.
+
+    Blocks partition the buffer: each one owns the blank and comment lines that follow
+    its statements. nodes keep the line numbers they were parsed with; offset maps them
+    to the current buffer. stale blocks were edited and still need a parse. error holds
+    the SyntaxError of a block that failed to parse.
+    """
+
+    __slots__ = ('start', 'end', 'offset', 'nodes', 'stale', 'error', 'entry', 'exit', 'counts', 'findings', 'peak')
+
+    def __init__(self, start, end, offset=0, nodes=(), stale=False, error=None):
+        self.start = start
+        self.end = end
+        self.offset = offset
+        self.nodes = nodes
+        self.stale = stale
+        self.error = error
+        self.entry = None  # visitor state this block was scored with
+        self.exit = _EMPTY_STATE
+        self.counts = Counter()
+        self.findings = []
+        self.peak = 0
+
+    def shift(self, delta):
+        self.start += delta
+        self.end += delta
+        self.offset += delta
+
+
+class Session:
+    """An editor buffer with the analysis of each top-level statement kept between edits.
+
+    An edit marks the blocks it touches stale. Only those are re-parsed and re-scored,
+    and their node counts are swapped into the running totals, so the cost of an edit
+    follows the size of the statements it touches rather than the size of the file.
+    When a stale region does not parse on its own (an unclosed bracket or string that
+    continues past it, or an indented line joining the statement before it), the rest
+    of the buffer from the previous block on is parsed together.
+    """
+
+    def __init__(self, code):
+        self.id = uuid.uuid4().hex
+        self.version = 0
+        self.lines = code.split('\n')
+        self.blocks = [_Block(1, len(self.lines), stale=True)]
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.touched = time.monotonic()
+        self._reparse()
+
+    @property
+    def text(self):
+        return '\n'.join(self.lines)
+
+    def edit(self, version, edits):
+        """Applies text edits made against version and returns the new result.
+
+        Each edit is {'line', 'col', 'end_line', 'end_col', 'text'}: the range to replace,
+        with 1-based lines and 0-based character columns as in findings. Edits apply in
+        order, each against the buffer as left by the one before.
+        """
+        if version != self.version:
+            raise VersionMismatch(f'Session is at version {self.version}, edits are against {version}')
+        for edit in edits:
+            self._apply(edit)
+        self._reparse()
+        self.version += 1
+        return self.result()
+
+    def result(self):
+        for block in self.blocks:
+            if block.error is not None:
+                return syntax_error_result(block.error)
+        findings = [
+            dict(finding, line=finding['line'] + block.offset)
+            for block in self.blocks for finding in block.findings
+        ]
+        # tuple_swap is the one rule that looks across statements, including top-level ones
+        nodes = [(node, block.offset) for block in self.blocks for node in block.nodes]
+        for (first, offset), (second, _), (third, _) in zip(nodes, nodes[1:], nodes[2:]):
+            if is_swap(first, second, third):
+                findings.append({
+                    'id': 'tuple_swap',
+                    'line': first.lineno + offset,
+                    'col': first.col_offset,
+                    'message': DIRTY_PATTERNS['tuple_swap'],
+                })
+        return build_result(+self.counts, findings, max(block.peak for block in self.blocks))
+
+    def _apply(self, edit):
+        line, col, end_line, end_col = edit['line'], edit['col'], edit['end_line'], edit['end_col']
+        if not (1 <= line <= end_line <= len(self.lines)
+                and 0 <= col <= len(self.lines[line - 1]) and 0 <= end_col <= len(self.lines[end_line - 1])
+                and (line, col) <= (end_line, end_col)):
+            raise ValueError(f'Edit range {line}:{col}-{end_line}:{end_col} is outside the buffer')
+        replacement = (self.lines[line - 1][:col] + edit['text'] + self.lines[end_line - 1][end_col:]).split('\n')
+        self.lines[line - 1:end_line] = replacement
+        delta = len(replacement) - (end_line - line + 1)
+
+        first = bisect_left(self.blocks, line, key=lambda block: block.end)
+        last = bisect_left(self.blocks, end_line, key=lambda block: block.end)
+        for block in self.blocks[first:last + 1]:
+            self._discard(block)
+        for block in self.blocks[last + 1:]:
+            block.shift(delta)
+            if delta and block.error is not None:
+                block.stale = True  # its message quotes line numbers that just moved
+        start, end = self.blocks[first].start, self.blocks[last].end + delta
+        self.blocks[first:last + 1] = [_Block(start, end, stale=True)]
+
+    def _reparse(self):
+        index = 0
+        while index < len(self.blocks):
+            if self.blocks[index].stale:
+                index = self._parse_region(index)
+            index += 1
+        self._rescore()
+
+    def _parse_region(self, index):
+        """Replaces the stale block at index with parsed blocks and returns the index of the last one."""
+        block = self.blocks[index]
+        offset = block.start - 1
+        try:
+            tree = ast.parse('\n'.join(self.lines[block.start - 1:block.end]))
+            end = index + 1
+        except SyntaxError as e:
+            if e.msg.endswith('was never closed') and all(
+                    not later.stale and later.error is None for later in self.blocks[index + 1:]):
+                # Every later block parses on its own, so none of them can close the bracket
+                e.lineno += offset
+                if e.end_lineno:
+                    e.end_lineno += offset
+                block.stale, block.error = False, e
+                return index
+            # Parse everything from the statement before to the end of the buffer instead
+            if index:
+                index -= 1
+            block = self.blocks[index]
+            for later in self.blocks[index:]:
+                self._discard(later)
+            end = len(self.blocks)
+            block = _Block(block.start, len(self.lines))
+            try:
+                # Padded so node lines and error messages match the whole buffer
+                tree = ast.parse('\n' * (block.start - 1) + '\n'.join(self.lines[block.start - 1:]))
+            except SyntaxError as e:
+                block.error = e
+                self.blocks[index:] = [block]
+                return index
+            offset = 0
+        parsed = self._split(tree, block.start, block.end, offset)
+        if parsed[0].nodes == () and index:
+            # Leading blank or comment lines belong to the block before
+            self.blocks[index - 1].end = parsed.pop(0).end
+        self.blocks[index:end] = parsed
+        return index + len(parsed) - 1 if parsed else index - 1
+
+    def _split(self, tree, start, end, offset):
+        groups = []
+        for node in tree.body:
+            first = min([node.lineno] + [d.lineno for d in getattr(node, 'decorator_list', ())]) + offset
+            if groups and first <= groups[-1][1]:
+                # Statements sharing a line (a = 1; b = 2) stay in one block
+                groups[-1][2].append(node)
+                groups[-1][1] = node.end_lineno + offset
+            else:
+                groups.append([first, node.end_lineno + offset, [node]])
+        blocks = []
+        if not groups or groups[0][0] > start:
+            blocks.append(_Block(start, groups[0][0] - 1 if groups else end))
+        for position, (first, _, nodes) in enumerate(groups):
+            last = groups[position + 1][0] - 1 if position + 1 < len(groups) else end
+            blocks.append(_Block(first, last, offset, tuple(nodes)))
+        return blocks
+
+    def _rescore(self):
+        # Blocks depend on the names bound to lists and strings before them, so a block
+        # is re-scored when its own nodes changed or the state it starts from did
+        state = _EMPTY_STATE
+        for block in self.blocks:
+            if block.entry != state:
+                self._discard(block)
+                visitor = EnergyVisitor()
+                visitor.list_names, visitor.str_names = set(state[0]), set(state[1])
+                for node in block.nodes:
+                    visitor.visit(node)
+                block.entry = state
+                block.exit = (frozenset(visitor.list_names), frozenset(visitor.str_names))
+                block.counts = visitor.counts
+                block.findings = visitor.findings
+                block.peak = visitor.peak_bytes
+                self.counts.update(block.counts)
+            state = block.exit
+
+    def _discard(self, block):
+        if block.entry is not None:
+            self.counts.subtract(block.counts)
+            block.entry = None
+
+
+class SessionStore:
+    """Open sessions, dropped least-recently-used past max_sessions or after ttl idle seconds."""
+
+    def __init__(self, max_sessions=1000, ttl=1800):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open(self, code):
+        session = Session(code)
+        with self._lock:
+            self._expire()
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id):
+        """Returns the session, raising KeyError when it is unknown or expired."""
+        with self._lock:
+            self._expire()
+            session = self._sessions[session_id]
+            self._sessions.move_to_end(session_id)
+            session.touched = time.monotonic()
+            return session
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def close(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self):
+        deadline = time.monotonic() - self.ttl
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.touched >= deadline:
+                break
+            self._sessions.popitem(last=False)
+
+
+SESSIONS = SessionStore(
+    max_sessions=int(os.environ.get('GREENCODE_SESSION_LIMIT', '1000')),
+    ttl=float(os.environ.get('GREENCODE_SESSION_TTL', '1800')),
+)
@@ -0,0 +1,222 @@
+import cProfile
+import io
+import math
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from .rules import RULES
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RULE_BUCKETS = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1, 0.5)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+LINES_BUCKETS = (10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _label_text(self, key, extra=()):
+        pairs = [*zip(self.labels, key), *extra]
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._samples(key, value))
+        return lines
+
+
+class CounterMetric(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self, key, value):
+        return [f'{self.name}{self._label_text(key)} {_number(value)}']
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets, labels=()):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            state[1] += 1
+            state[2] += value
+
+    def _samples(self, key, state):
+        counts, total, value_sum = state
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{self._label_text(key, [("le", _number(bound))])} {cumulative}')
+        lines.append(f'{self.name}_bucket{self._label_text(key, [("le", "+Inf")])} {total}')
+        lines.append(f'{self.name}_sum{self._label_text(key)} {_number(value_sum)}')
+        lines.append(f'{self.name}_count{self._label_text(key)} {total}')
+        return lines
+
+
+class Registry:
+    """Metrics in the Prometheus text exposition format.
+
+    Counters and histograms are updated as requests run. Collectors are callables
+    polled at scrape time for values that live elsewhere, like cache and pool sizes;
+    each returns (name, kind, help, value) tuples.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labels=()):
+        metric = CounterMetric(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, buckets, labels=()):
+        metric = Histogram(name, help, buckets, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func):
+        self._collectors.append(func)
+        return func
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        for collect in self._collectors:
+            for name, kind, help, value in collect():
+                lines.extend([f'# HELP {name} {help}', f'# TYPE {name} {kind}', f'{name} {_number(value)}'])
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'greencode_http_request_duration_seconds', 'HTTP request latency.', LATENCY_BUCKETS, ('method', 'route', 'status'))
+STAGE_SECONDS = REGISTRY.histogram(
+    'greencode_analysis_stage_seconds', 'Time per analysis stage (parse, traversal, scoring).', LATENCY_BUCKETS, ('stage',))
+RULE_SECONDS = REGISTRY.histogram(
+    'greencode_rule_seconds', 'Time spent in each rule check for one input, on sampled requests.', RULE_BUCKETS, ('rule',))
+INPUT_BYTES = REGISTRY.histogram('greencode_input_bytes', 'Size of analyzed inputs in bytes.', BYTES_BUCKETS, ('endpoint',))
+INPUT_LINES = REGISTRY.histogram('greencode_input_lines', 'Size of analyzed inputs in lines.', LINES_BUCKETS, ('endpoint',))
+
+
+def timed_rules(rule_ns):
+    """A copy of RULES with every check wrapped to add its run time to rule_ns[check name]."""
+    def timed(check):
+        name = check.__name__
+
+        def run(node, visitor):
+            start = time.perf_counter_ns()
+            check(node, visitor)
+            rule_ns[name] += time.perf_counter_ns() - start
+        return run
+    return {node_type: [timed(check) for check in checks] for node_type, checks in RULES.items()}
+
+
+def record_analysis(stages, rule_ns=None):
+    for stage, seconds in stages.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    for rule, ns in (rule_ns or {}).items():
+        RULE_SECONDS.observe(ns / 1e9, rule=rule)
+
+
+def record_input(endpoint, code):
+    INPUT_BYTES.observe(len(code.encode('utf-8', 'surrogatepass')), endpoint=endpoint)
+    INPUT_LINES.observe(code.count('\n') + 1, endpoint=endpoint)
+
+
+def profile_analysis(analyze, code, cpu=True, memory=True, top=20):
+    """Runs analyze(code, stages, rule_ns) under cProfile and/or tracemalloc.
+
+    Returns (result, summary). The CPU summary lists the functions with the most own
+    time; the memory summary gives the peak traced allocation and the lines that
+    allocated most. tracemalloc is process-wide, so run one profile at a time.
+    """
+    stages, rule_ns = {}, Counter()
+    profiler = cProfile.Profile() if cpu else None
+    if memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        result = analyze(code, stages, rule_ns)
+    finally:
+        wall = time.perf_counter() - start
+        if profiler:
+            profiler.disable()
+        if memory:
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    summary = {
+        'wall_ms': round(wall * 1000, 3),
+        'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()},
+        'rules_ms': {rule: round(ns / 1e6, 3) for rule, ns in rule_ns.most_common()},
+    }
+    if profiler:
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+        summary['cpu'] = [{
+            'function': pstats.func_std_string(func),
+            'calls': calls,
+            'own_ms': round(own * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3),
+        } for func, (_, calls, own, cumulative, _) in rows]
+    if memory:
+        summary['memory'] = {
+            'peak_kb': round(peak / 1024, 1),
+            'top': [{
+                'location': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+                'size_kb': round(stat.size / 1024, 1),
+                'count': stat.count,
+            } for stat in snapshot.statistics('lineno')[:top]],
+        }
+    return result, summary
@@ -0,0 +1,212 @@
+import ast
+
+# Messages for every rule the visitor can report, keyed by rule id. The ids of the
+# ported regex rules match GreenAnalyzerPro.registry so both engines agree.
+DIRTY_PATTERNS = {
+    'for_range_len': 'Use direct iteration instead of range(len(x))',
+    'list_append_loop': 'Use list comprehensions instead of append in loops',
+    'loops': 'Consider minimizing loops or using vectorized operations (e.g., NumPy)',
+    'nested_loops': 'Detected nested loops. This can exponentially increase energy consumption.',
+    'gen_exp': 'Use generator: sum(x for x in data)',
+    'str_concat': "Use ''.join(list) instead of +=",
+    'set_lookup': 'Convert list to set() for O(1) lookup',
+    'file_stream': 'Use streaming: with open() as f: for line in f:',
+    'busy_wait': 'Use time.sleep() to reduce CPU cycles',
+    'map_filt': 'Use list comprehensions',
+    'global_ref': 'Use local variables instead of globals',
+    'df_iter': 'Use .itertuples() for Pandas iteration',
+    'len_cache': 'Cache len() in a variable before the loop',
+    'enum_opt': 'Use enumerate()',
+    'dict_keys': "Check 'if k in d' directly",
+    'string_io': 'Use io.StringIO',
+    'tuple_swap': "Use 'a, b = b, a'",
+    'imp_loop': 'Move imports to top of file',
+    'while_one': "Use 'while True'",
+    'list_ext': 'Use .extend()',
+    'try_loop': 'Move try/except outside the loop',
+    'pow_opt': "Use 'x * x'",
+    'gc_man': 'Enable gc.collect() manually',
+    'large_alloc': 'Builds a large collection in memory at once; iterate lazily or process it in chunks',
+}
+
+# Rules about materializing data in memory rather than about CPU work
+MEMORY_RULES = {'gen_exp', 'file_stream', 'str_concat', 'string_io', 'df_iter', 'large_alloc'}
+
+# Rules that also feed the 'suggestions' list of analyze_code, with its wording
+SUGGESTIONS = {
+    'loops': DIRTY_PATTERNS['loops'],
+    'nested_loops': DIRTY_PATTERNS['nested_loops'],
+    'enum_opt': DIRTY_PATTERNS['for_range_len'],
+}
+
+# Bumped whenever a rule is added or changes what it reports
+RULESET_VERSION = 3
+
+LOOP_NODES = (ast.For, ast.While)
+
+# Statement types whose bodies are scanned for statement sequences
+BLOCK_NODES = (
+    ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.For, ast.AsyncFor,
+    ast.While, ast.If, ast.With, ast.AsyncWith, ast.Try, ast.ExceptHandler,
+)
+
+# node type -> rule callbacks, called as rule(node, visitor) in a single traversal
+RULES = {}
+
+
+def rule(*node_types):
+    """Registers a check for the given node types."""
+    def register(func):
+        for node_type in node_types:
+            RULES.setdefault(node_type, []).append(func)
+        return func
+    return register
+
+
+def _is_call(node, name):
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == name
+
+
+def _is_method_call(node, name):
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == name
+
+
+def _is_str(node):
+    return isinstance(node, ast.Constant) and isinstance(node.value, str)
+
+
+@rule(ast.For, ast.While)
+def check_loops(node, visitor):
+    visitor.report('loops', node)
+    if visitor.loop_depth:
+        visitor.report('nested_loops', node)
+
+
+@rule(ast.Call)
+def check_range_len(node, visitor):
+    if _is_call(node, 'range') and len(node.args) == 1 and _is_call(node.args[0], 'len'):
+        visitor.report('enum_opt', node)
+
+
+@rule(ast.Call)
+def check_generator_args(node, visitor):
+    if _is_call(node, 'sum') and len(node.args) == 1 and isinstance(node.args[0], ast.ListComp):
+        visitor.report('gen_exp', node)
+
+
+@rule(ast.Call)
+def check_map_filter(node, visitor):
+    if (_is_call(node, 'map') or _is_call(node, 'filter')) and node.args and isinstance(node.args[0], ast.Lambda):
+        visitor.report('map_filt', node)
+
+
+@rule(ast.Call)
+def check_method_calls(node, visitor):
+    if _is_method_call(node, 'read') and _is_call(node.func.value, 'open'):
+        visitor.report('file_stream', node)
+    elif _is_method_call(node, 'iterrows'):
+        visitor.report('df_iter', node)
+    elif _is_method_call(node, 'disable') and isinstance(node.func.value, ast.Name) and node.func.value.id == 'gc':
+        visitor.report('gc_man', node)
+    elif _is_method_call(node, 'keys') and not node.args and not node.keywords:
+        # Any .keys() call, like the regex rule; only some of them can be fixed mechanically
+        visitor.report('dict_keys', node)
+
+
+@rule(ast.Assign)
+def track_bindings(node, visitor):
+    # Remember names bound to lists and strings for the membership and concat rules
+    for target in node.targets:
+        if not isinstance(target, ast.Name):
+            continue
+        if isinstance(node.value, (ast.List, ast.ListComp)) or _is_call(node.value, 'list'):
+            visitor.list_names.add(target.id)
+        else:
+            visitor.list_names.discard(target.id)
+        if _is_str(node.value) or isinstance(node.value, ast.JoinedStr):
+            visitor.str_names.add(target.id)
+        else:
+            visitor.str_names.discard(target.id)
+
+
+@rule(ast.Compare)
+def check_membership(node, visitor):
+    for op, comparator in zip(node.ops, node.comparators):
+        if not isinstance(op, (ast.In, ast.NotIn)):
+            continue
+        if (isinstance(comparator, (ast.List, ast.ListComp)) or _is_call(comparator, 'list')
+                or isinstance(comparator, ast.Name) and comparator.id in visitor.list_names):
+            visitor.report('set_lookup', node)
+
+
+@rule(ast.For)
+def check_for_loop(node, visitor):
+    if (len(node.body) == 1 and not node.orelse and isinstance(node.body[0], ast.Expr)
+            and _is_method_call(node.body[0].value, 'append') and len(node.body[0].value.args) == 1):
+        visitor.report('list_ext', node)
+
+
+@rule(ast.While)
+def check_while_loop(node, visitor):
+    test = node.test
+    if isinstance(test, ast.Constant) and test.value == 1 and test.value is not True:
+        visitor.report('while_one', node)
+    if isinstance(test, ast.Constant) and test.value is True and isinstance(node.body[0], ast.Pass):
+        visitor.report('busy_wait', node)
+    if any(_is_call(child, 'len') for child in ast.walk(test)):
+        visitor.report('len_cache', node)
+
+
+@rule(ast.AugAssign)
+def check_string_building(node, visitor):
+    if (visitor.loop_depth and isinstance(node.op, ast.Add) and isinstance(node.target, ast.Name)
+            and node.target.id in visitor.str_names):
+        visitor.report('str_concat' if _is_str(node.value) else 'string_io', node)
+
+
+@rule(ast.BinOp)
+def check_power(node, visitor):
+    if isinstance(node.op, ast.Pow) and isinstance(node.right, ast.Constant) and node.right.value == 2:
+        visitor.report('pow_opt', node)
+
+
+@rule(ast.Global)
+def check_global(node, visitor):
+    visitor.report('global_ref', node)
+
+
+@rule(ast.Import, ast.ImportFrom)
+def check_import(node, visitor):
+    if visitor.loop_depth:
+        visitor.report('imp_loop', node)
+
+
+@rule(ast.Try)
+def check_try(node, visitor):
+    if visitor.loop_depth:
+        visitor.report('try_loop', node)
+
+
+@rule(*BLOCK_NODES)
+def check_swaps(node, visitor):
+    # temp = a; a = b; b = temp
+    for field in ('body', 'orelse', 'finalbody'):
+        stmts = getattr(node, field, None) or []
+        for first, second, third in zip(stmts, stmts[1:], stmts[2:]):
+            if is_swap(first, second, third):
+                visitor.report('tuple_swap', first)
+
+
+def is_swap(first, second, third):
+    names = [_simple_assign(stmt) for stmt in (first, second, third)]
+    if None in names:
+        return False
+    (temp, a), (a2, b), (b2, temp2) = names
+    return temp == temp2 and a == a2 and b == b2 and len({temp, a, b}) == 3
+
+
+def _simple_assign(stmt):
+    if (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and isinstance(stmt.targets[0], ast.Name)
+            and isinstance(stmt.value, ast.Name)):
+        return stmt.targets[0].id, stmt.value.id
+    return None
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import math
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .analyzer import MODEL_VERSION, RESULT_CACHE, _analyze
+from .metrics import record_analysis
+
+
+class Saturated(Exception):
+    """The work queue is full. retry_after is a hint in whole seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Analysis queue is full, retry in {retry_after}s')
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """The analysis did not finish within the request's deadline."""
+
+
+class _Job:
+    __slots__ = ('future', 'deadline', 'waiters')
+
+    def __init__(self, future, deadline):
+        self.future = future
+        self.deadline = deadline
+        self.waiters = 0
+
+
+def _compute(code, time_rules):
+    # Runs in the executor. JSON text pickles cheaply and goes straight into the cache;
+    # stage timings travel back with it because metrics live in the serving process.
+    stages, rule_ns = {}, Counter() if time_rules else None
+    return json.dumps(_analyze(code, stages, rule_ns)), stages, rule_ns
+
+
+class AnalysisService:
+    """Runs analyze_code off the event loop with admission control.
+
+    At most `workers` analyses run at once, on a dedicated process (or thread) pool.
+    Up to max_queue more wait for a slot; past that, requests are refused with
+    Saturated rather than queued, so latency stays bounded under bursts. Identical
+    payloads in flight share one analysis. A request waits at most its timeout, and
+    queued work is dropped if everyone waiting for it has given up. A rule_sample_rate
+    fraction of analyses also time every rule check for the metrics.
+    """
+
+    def __init__(self, workers=None, max_queue=64, timeout=10.0, processes=True, rule_sample_rate=0.05):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.processes = processes
+        self.rule_sample_rate = rule_sample_rate
+        self._executor = None
+        self._slots = None
+        self._jobs = {}  # cache key -> _Job in flight
+        self._queued = 0
+        self._running = 0
+        self._service_time = 0.05  # moving average in seconds, for Retry-After
+        self.completed = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.expired = 0
+
+    async def analyze(self, code, timeout=None):
+        """Returns the analysis of code, raising Saturated or DeadlineExceeded."""
+        timeout = min(timeout or self.timeout, self.timeout)
+        key = RESULT_CACHE.key(code, MODEL_VERSION, 'analyze_code')
+        text = await _cached(RESULT_CACHE.get, key)
+        if text is not None:
+            return json.loads(text)
+        deadline = time.monotonic() + timeout
+        job = self._jobs.get(key)
+        if job is None:
+            if self._queued - (self.workers - self._running) >= self.max_queue:
+                self.rejected += 1
+                raise Saturated(self.retry_after())
+            job = _Job(asyncio.get_running_loop().create_future(), deadline)
+            job.future.add_done_callback(_consume)
+            self._jobs[key] = job
+            self._queued += 1
+            asyncio.ensure_future(self._run(key, code, job))
+        else:
+            self.coalesced += 1
+            job.deadline = max(job.deadline, deadline)
+        job.waiters += 1
+        try:
+            text = await asyncio.wait_for(asyncio.shield(job.future), timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f'Analysis did not finish within {timeout:g}s')
+        finally:
+            job.waiters -= 1
+        return json.loads(text)
+
+    async def _run(self, key, code, job):
+        loop = asyncio.get_running_loop()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        try:
+            async with self._slots:
+                self._queued -= 1
+                if not job.waiters or time.monotonic() > job.deadline:
+                    # Everyone waiting for this gave up while it was queued. A waiter whose
+                    # timeout has not fired yet still gets DeadlineExceeded, not a cancellation.
+                    self.expired += 1
+                    job.future.set_exception(DeadlineExceeded('Analysis deadline passed while queued'))
+                    return
+                self._running += 1
+                start = time.monotonic()
+                time_rules = random.random() < self.rule_sample_rate
+                try:
+                    text, stages, rule_ns = await loop.run_in_executor(self._get_executor(), _compute, code, time_rules)
+                finally:
+                    self._running -= 1
+                self._service_time += (time.monotonic() - start - self._service_time) * 0.1
+            record_analysis(stages, rule_ns)
+            self.completed += 1
+            job.future.set_result(text)
+            await _cached(RESULT_CACHE.put, key, text)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            if self._jobs.get(key) is job:
+                del self._jobs[key]
+
+    def retry_after(self):
+        backlog = (self._queued + self._running) * self._service_time / self.workers
+        return max(1, math.ceil(backlog))
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'executor': 'process' if self.processes else 'thread',
+            'queued': self._queued,
+            'running': self._running,
+            'max_queue': self.max_queue,
+            'completed': self.completed,
+            'coalesced': self.coalesced,
+            'rejected': self.rejected,
+            'expired': self.expired,
+            'service_time_ms': round(self._service_time * 1000, 3),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            pool = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+            self._executor = pool(max_workers=self.workers)
+        return self._executor
+
+
+async def _cached(method, *args):
+    # With the SQLite tier a lookup reads and a store commits, which would stall every
+    # request on the loop; memory-only calls are cheaper than the hop to a thread
+    if RESULT_CACHE.persistent:
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+    return method(*args)
+
+
+def _consume(future):
+    # Retrieve the outcome so a job nobody waits for any more does not log "never retrieved"
+    if not future.cancelled():
+        future.exception()
+
+
+def service_from_env():
+    """Builds an AnalysisService configured by the GREENCODE_SERVING_* environment variables."""
+    workers = os.environ.get('GREENCODE_SERVING_WORKERS')
+    return AnalysisService(
+        workers=int(workers) if workers else None,
+        max_queue=int(os.environ.get('GREENCODE_SERVING_QUEUE', '64')),
+        timeout=float(os.environ.get('GREENCODE_ANALYZE_TIMEOUT', '10')),
+        processes=os.environ.get('GREENCODE_SERVING_EXECUTOR', 'process') == 'process',
+        rule_sample_rate=float(os.environ.get('GREENCODE_RULE_SAMPLE_RATE', '0.05')),
+    )
@@ -0,0 +1,399 @@
+"""Per-commit results in a SQLite store, and base/head diffs that only analyze new content.
+
+Files are keyed by their git blob hash, so a file is analyzed once per content and
+model version however many commits, branches or directories it appears in. Run from
+the repository root:
+
+    python -m backend.engine.trends diff origin/main HEAD --record
+    python -m backend.engine.trends history
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+from .analyzer import MODEL_VERSION, EnergyVisitor, build_result, syntax_error_result
+from .batch import MAX_FILE_BYTES, chunked, get_pool, summarize
+
+FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+FUNCTION_FIELDS = ('energy', 'co2', 'score', 'estimated_ns', 'estimated_peak_bytes')
+
+
+def blob_hash(data: bytes):
+    """The git blob id of data, so files read from disk and from git share keys."""
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+def analyze_file(code):
+    """Analyzes a file and each function in it. Returns (result, {qualified name: function result}).
+
+    A function's result covers its own body as if called once; nested functions are
+    counted in their parents too. Each carries the hash of its source, so changed
+    functions can be told apart from ones that only moved.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return syntax_error_result(e), {}
+    visitor = EnergyVisitor()
+    visitor.visit(tree)
+    result = build_result(visitor.counts, visitor.findings, visitor.peak_bytes)
+    lines = code.split('\n')
+    functions = {}
+    for name, node in _functions(tree):
+        function_visitor = EnergyVisitor()
+        function_visitor.visit(node)
+        function = build_result(function_visitor.counts, function_visitor.findings, function_visitor.peak_bytes)
+        source = '\n'.join(lines[node.lineno - 1:node.end_lineno])
+        functions[name] = dict(
+            {field: function[field] for field in FUNCTION_FIELDS},
+            line=node.lineno,
+            findings=len(function['findings']),
+            hash=hashlib.sha1(source.encode('utf-8', 'surrogatepass')).hexdigest(),
+        )
+    return result, functions
+
+
+def _functions(tree, prefix=''):
+    for node in ast.iter_child_nodes(tree):
+        if isinstance(node, FUNCTION_NODES + (ast.ClassDef,)):
+            name = prefix + node.name
+            if isinstance(node, FUNCTION_NODES):
+                yield name, node
+            yield from _functions(node, name + '.')
+        elif isinstance(node, ast.stmt):
+            yield from _functions(node, prefix)
+
+
+def analyze_blobs(items):
+    """Analyzes a chunk of (blob, code) pairs. Runs inside the process pool."""
+    results = []
+    for blob, code in items:
+        if code is None:
+            results.append((blob, {'error': f'File larger than {MAX_FILE_BYTES} bytes'}, {}))
+            continue
+        try:
+            result, functions = analyze_file(code)
+        except (ValueError, RecursionError, MemoryError) as e:
+            result, functions = {'error': f'Could not analyze file: {e}'}, {}
+        result['lines'] = code.count('\n') + 1
+        results.append((blob, result, functions))
+    return results
+
+
+class TrendStore:
+    """SQLite store of file and function results by content, and of project runs over time."""
+
+    def __init__(self, db_path, model=MODEL_VERSION):
+        self.model = model
+        self._db = sqlite3.connect(db_path)
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                blob TEXT, model TEXT, result TEXT, functions TEXT, PRIMARY KEY (blob, model));
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY, ref TEXT, revision TEXT, created REAL, model TEXT, summary TEXT);
+            CREATE TABLE IF NOT EXISTS run_files (
+                run INTEGER, path TEXT, blob TEXT, PRIMARY KEY (run, path));
+            CREATE TABLE IF NOT EXISTS benchmarks (
+                id INTEGER PRIMARY KEY, created REAL, report TEXT);
+        ''')
+        self.analyzed = 0
+        self.reused = 0
+
+    def results(self, tree, read):
+        """Returns {path: (result, functions)} for a {path: blob} tree.
+
+        Only blobs without a stored result for this model are read (read(blobs) must
+        return {blob: code}) and analyzed; the rest come from the store.
+        """
+        blobs = set(tree.values())
+        stored = {}
+        for chunk in _batches(sorted(blobs)):
+            rows = self._db.execute(
+                f'SELECT blob, result, functions FROM files WHERE model = ? AND blob IN ({",".join("?" * len(chunk))})',
+                [self.model, *chunk])
+            stored.update((blob, (json.loads(result), json.loads(functions))) for blob, result, functions in rows)
+        missing = sorted(blobs - stored.keys())
+        self.reused += len(blobs) - len(missing)
+        if missing:
+            sources = read(missing)
+            items = [(blob, sources[blob]) for blob in missing]
+            if len(items) > 1:
+                computed = [row for rows in get_pool().map(analyze_blobs, chunked(items)) for row in rows]
+            else:
+                computed = analyze_blobs(items)
+            with self._db:
+                self._db.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)', [
+                    (blob, self.model, json.dumps(result), json.dumps(functions)) for blob, result, functions in computed
+                ])
+            stored.update((blob, (result, functions)) for blob, result, functions in computed)
+            self.analyzed += len(missing)
+        return {path: stored[blob] for path, blob in tree.items()}
+
+    def record(self, ref, revision, tree, summary):
+        with self._db:
+            run = self._db.execute(
+                'INSERT INTO runs (ref, revision, created, model, summary) VALUES (?, ?, ?, ?, ?)',
+                (ref, revision, time.time(), self.model, json.dumps(summary))).lastrowid
+            self._db.executemany('INSERT INTO run_files VALUES (?, ?, ?)', [(run, path, blob) for path, blob in tree.items()])
+        return run
+
+    def history(self, ref=None, limit=50):
+        """Recorded runs, oldest first, as dicts with ref, revision, created, model and summary."""
+        query = 'SELECT ref, revision, created, model, summary FROM runs'
+        params = []
+        if ref:
+            query += ' WHERE ref = ?'
+            params.append(ref)
+        rows = self._db.execute(query + ' ORDER BY id DESC LIMIT ?', [*params, limit]).fetchall()
+        return [
+            {'ref': r, 'revision': rev, 'created': created, 'model': model, 'summary': json.loads(summary)}
+            for r, rev, created, model, summary in reversed(rows)
+        ]
+
+    def record_benchmark(self, report):
+        """Keeps a testing_suite.py report, which otherwise only lives in files overwritten by the next run."""
+        with self._db:
+            return self._db.execute(
+                'INSERT INTO benchmarks (created, report) VALUES (?, ?)', (time.time(), json.dumps(report))).lastrowid
+
+    def benchmark_history(self, limit=50):
+        rows = self._db.execute('SELECT report FROM benchmarks ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        return [json.loads(report) for report, in reversed(rows)]
+
+    def close(self):
+        self._db.close()
+
+
+def _batches(items, size=500):
+    # SQLite caps the number of bound parameters per statement
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def diff(store, base_tree, head_tree, read):
+    """Compares two {path: blob} trees: project totals, and every changed file and function.
+
+    Unchanged files cost nothing once their blobs are in the store, so after the first
+    run the work follows the size of the change.
+    """
+    base = store.results(base_tree, read)
+    head = store.results(head_tree, read)
+    base_summary = summarize([dict(result, path=path) for path, (result, _) in base.items()])
+    head_summary = summarize([dict(result, path=path) for path, (result, _) in head.items()])
+    files = []
+    for path in sorted(base_tree.keys() | head_tree.keys()):
+        if base_tree.get(path) == head_tree.get(path):
+            continue
+        old, new = base.get(path), head.get(path)
+        entry = {
+            'path': path,
+            'status': 'added' if old is None else 'removed' if new is None else 'modified',
+            'base': _file_fields(old[0]) if old else None,
+            'head': _file_fields(new[0]) if new else None,
+            'functions': _function_changes(old[1] if old else {}, new[1] if new else {}),
+        }
+        entry['delta'] = _delta(entry['base'], entry['head'])
+        files.append(entry)
+    return {
+        'model': store.model,
+        'base': base_summary,
+        'head': head_summary,
+        'delta': _delta(base_summary, head_summary),
+        'files': files,
+    }
+
+
+def _file_fields(result):
+    if 'error' in result:
+        return {'error': result['error']}
+    return {field: result[field] for field in FUNCTION_FIELDS + ('lines',)}
+
+
+def _function_changes(old, new):
+    changes = []
+    for name in sorted(old.keys() | new.keys()):
+        before, after = old.get(name), new.get(name)
+        if before and after and before['hash'] == after['hash']:
+            continue
+        changes.append({
+            'name': name,
+            'status': 'added' if before is None else 'removed' if after is None else 'modified',
+            'base': before,
+            'head': after,
+            'delta': _delta(before, after),
+        })
+    return changes
+
+
+def _delta(before, after):
+    before = before if before and 'error' not in before else {}
+    after = after if after and 'error' not in after else {}
+    delta = {}
+    for field in ('energy', 'co2', 'score', 'estimated_ns', 'estimated_peak_bytes'):
+        # Added and removed code changes the totals, but a score has nothing to compare against
+        if field == 'score' and not (before and after):
+            continue
+        if field in before or field in after:
+            change = after.get(field, 0) - before.get(field, 0)
+            delta[field] = round(change, 6) if isinstance(change, float) else change
+    return delta
+
+
+def git_tree(repo, ref):
+    """{path: blob} of the .py files at ref."""
+    output = subprocess.run(
+        ['git', '-C', repo, 'ls-tree', '-r', '-z', '--full-tree', ref],
+        capture_output=True, check=True).stdout.decode('utf-8', 'surrogateescape')
+    tree = {}
+    for line in filter(None, output.split('\0')):
+        meta, path = line.split('\t', 1)
+        _, kind, blob = meta.split()
+        if kind == 'blob' and path.endswith('.py'):
+            tree[path] = blob
+    return tree
+
+
+def git_reader(repo):
+    def read(blobs):
+        # One cat-file process for every blob instead of a git show per file
+        output = subprocess.run(
+            ['git', '-C', repo, 'cat-file', '--batch'],
+            input='\n'.join(blobs).encode() + b'\n', capture_output=True, check=True).stdout
+        sources, pos = {}, 0
+        for blob in blobs:
+            header_end = output.index(b'\n', pos)
+            size = int(output[pos:header_end].split()[2])
+            start = header_end + 1
+            data = output[start:start + size]
+            sources[blob] = None if size > MAX_FILE_BYTES else data.decode('utf-8', errors='replace')
+            pos = start + size + 1
+        return sources
+    return read
+
+
+def directory_tree(root):
+    """{path: blob} of the .py files under root, and a reader for them."""
+    tree, paths = {}, {}
+    for directory, dirs, names in os.walk(root):
+        dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ('__pycache__', 'node_modules', 'venv')]
+        for name in names:
+            if name.endswith('.py'):
+                full = os.path.join(directory, name)
+                with open(full, 'rb') as f:
+                    data = f.read()
+                path = os.path.relpath(full, root).replace(os.sep, '/')
+                tree[path] = blob = blob_hash(data)
+                paths[blob] = full
+
+    def read(blobs):
+        sources = {}
+        for blob in blobs:
+            if os.path.getsize(paths[blob]) > MAX_FILE_BYTES:
+                sources[blob] = None
+                continue
+            with open(paths[blob], 'rb') as f:
+                sources[blob] = f.read().decode('utf-8', errors='replace')
+        return sources
+    return tree, read
+
+
+def load_tree(repo, target):
+    """A directory or a git revision, as ({path: blob}, reader, revision or None)."""
+    if os.path.isdir(target):
+        tree, read = directory_tree(target)
+        return tree, read, None
+    revision = subprocess.run(
+        ['git', '-C', repo, 'rev-parse', '--verify', f'{target}^{{commit}}'],
+        capture_output=True, check=True, text=True).stdout.strip()
+    return git_tree(repo, revision), git_reader(repo), revision
+
+
+def _readers(*readers):
+    # Blobs are content hashes, so any reader that knows a blob returns the same text
+    def read(blobs):
+        sources = {}
+        for reader, known in readers:
+            wanted = [blob for blob in blobs if blob in known and blob not in sources]
+            if wanted:
+                sources.update(reader(wanted))
+        return sources
+    return read
+
+
+def print_report(report, out=sys.stdout):
+    delta = report['delta']
+    print(f"score {report['base']['score']} -> {report['head']['score']} ({delta['score']:+d}), "
+          f"runtime {delta['estimated_ns'] / 1e6:+.3f} ms, energy {delta['energy']:+.4g} Wh, co2 {delta['co2']:+.4g} g, "
+          f"{len(report['files'])} changed files", file=out)
+    for entry in report['files']:
+        print(f"  {entry['status']:<9}{entry['path']:<50}{_change_text(entry['delta'])}", file=out)
+        for function in entry['functions']:
+            print(f"    {function['status']:<9}{function['name']:<48}{_change_text(function['delta'])}", file=out)
+
+
+def _change_text(delta):
+    score = f"{delta['score']:+4d}" if 'score' in delta else '    '
+    return f"{score}  {delta.get('estimated_ns', 0) / 1e6:+10.3f} ms"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Project trend store and base/head diffs.')
+    parser.add_argument('--db', default=os.environ.get('GREENCODE_TREND_DB', '.greencode-trends.db'))
+    parser.add_argument('--repo', default='.', help='git repository that revisions refer to')
+    commands = parser.add_subparsers(dest='command', required=True)
+    diff_parser = commands.add_parser('diff', help='compare two revisions or directories')
+    diff_parser.add_argument('base')
+    diff_parser.add_argument('head')
+    diff_parser.add_argument('--json', help='write the full report here')
+    diff_parser.add_argument('--record', action='store_true', help='also record head as a run')
+    diff_parser.add_argument('--max-score-drop', type=int, help='exit 1 if the project score drops by more')
+    record_parser = commands.add_parser('record', help='record a revision or directory as a run')
+    record_parser.add_argument('target')
+    history_parser = commands.add_parser('history', help='list recorded runs')
+    history_parser.add_argument('--ref')
+    history_parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    store = TrendStore(args.db)
+    try:
+        if args.command == 'history':
+            for run in store.history(args.ref, args.limit):
+                summary = run['summary']
+                print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(run['created']))}  {run['ref']:<20}"
+                      f"{(run['revision'] or '')[:10]:<12}score {summary['score']:>3}  energy {summary['energy']:.4g} Wh  "
+                      f"co2 {summary['co2']:.4g} g  {summary['files']} files")
+            return 0
+        if args.command == 'record':
+            tree, read, revision = load_tree(args.repo, args.target)
+            results = store.results(tree, read)
+            summary = summarize([dict(result, path=path) for path, (result, _) in results.items()])
+            store.record(args.target, revision, tree, summary)
+            print(f"Recorded {args.target}: score {summary['score']}, {store.analyzed} files analyzed, {store.reused} reused")
+            return 0
+
+        base_tree, base_read, _ = load_tree(args.repo, args.base)
+        head_tree, head_read, head_revision = load_tree(args.repo, args.head)
+        read = _readers((base_read, set(base_tree.values())), (head_read, set(head_tree.values())))
+        report = diff(store, base_tree, head_tree, read)
+        print_report(report)
+        print(f"{store.analyzed} files analyzed, {store.reused} reused from {args.db}")
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        if args.record:
+            store.record(args.head, head_revision, head_tree, report['head'])
+        if args.max_score_drop is not None and -report['delta']['score'] > args.max_score_drop:
+            return 1
+        return 0
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
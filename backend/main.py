@@ -1,14 +1,35 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from engine.analyzer import analyze_code
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import List
+from engine.analyzer import RESULT_CACHE, _analyze
+from engine.batch import analyze_files, cache_results, chunked, get_pool, iter_archive, split_cached, summarize
+from engine.incremental import SESSIONS, VersionMismatch
+from engine.metrics import REGISTRY, REQUEST_SECONDS, profile_analysis, record_input
+from engine.serving import DeadlineExceeded, Saturated, service_from_env
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from typing import Optional
+import asyncio
+import json
 import sys
 import os
+import time
 
 # Add the parent directory to sys.path to allow importing from engine
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-app = FastAPI(title="Green-Code Registry")
+SERVICE = service_from_env()
+PROFILING = os.environ.get("GREENCODE_PROFILING", "0") == "1"
+# tracemalloc and cProfile are process-wide, so profiled requests run one at a time
+PROFILE_LOCK = asyncio.Lock()
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    SERVICE.shutdown()
+
+app = FastAPI(title="Green-Code Registry", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,12 +38,174 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template so /sessions/{session_id} stays one series
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route.path if route else "unmatched",
+            status=status,
+        )
+
+@REGISTRY.collector
+def collect_state():
+    cache = RESULT_CACHE.stats()
+    for name in ("hits", "disk_hits", "misses", "evictions"):
+        yield f"greencode_cache_{name}_total", "counter", f"Result cache {name.replace('_', ' ')}.", cache[name]
+    yield "greencode_cache_entries", "gauge", "Results held in memory.", cache["entries"]
+    yield "greencode_cache_bytes", "gauge", "Bytes of results held in memory.", cache["bytes"]
+    serving = SERVICE.stats()
+    yield "greencode_serving_queued", "gauge", "Analyses waiting for a worker.", serving["queued"]
+    yield "greencode_serving_running", "gauge", "Analyses running.", serving["running"]
+    for name in ("completed", "coalesced", "rejected", "expired"):
+        yield f"greencode_serving_{name}_total", "counter", f"Analyses {name}.", serving[name]
+    yield "greencode_sessions_open", "gauge", "Open incremental sessions.", len(SESSIONS)
+
 class CodeInput(BaseModel):
     code: str
 
+class SourceFile(BaseModel):
+    path: str
+    code: str
+
+class BatchInput(BaseModel):
+    files: List[SourceFile]
+
+class TextEdit(BaseModel):
+    line: int
+    col: int
+    end_line: int
+    end_col: int
+    text: str
+
+class EditInput(BaseModel):
+    version: int
+    edits: List[TextEdit]
+
 @app.post("/analyze")
-def analyze(input: CodeInput):
-    return analyze_code(input.code)
+async def analyze(
+    input: CodeInput,
+    x_request_timeout: Optional[float] = Header(None),
+    x_profile: Optional[str] = Header(None),
+    profile: Optional[str] = None,
+):
+    """Analyzes one snippet on the bounded analysis pool.
+
+    Answers 503 with Retry-After when the queue is full, and 504 when the analysis
+    does not finish within X-Request-Timeout seconds (capped by GREENCODE_ANALYZE_TIMEOUT).
+    With GREENCODE_PROFILING=1, ?profile=cpu|memory|all (or an X-Profile header) runs the
+    analysis in-process under cProfile/tracemalloc and adds a "profile" summary.
+    """
+    record_input("analyze", input.code)
+    mode = profile or x_profile
+    if mode:
+        return await profile_request(input.code, mode)
+    try:
+        return await SERVICE.analyze(input.code, timeout=x_request_timeout)
+    except Saturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+async def profile_request(code, mode):
+    if not PROFILING:
+        raise HTTPException(status_code=403, detail="Profiling is disabled, set GREENCODE_PROFILING=1")
+    if mode not in ("cpu", "memory", "all"):
+        raise HTTPException(status_code=422, detail="profile must be cpu, memory or all")
+    async with PROFILE_LOCK:
+        # Bypasses the cache and worker pool so the profile covers a real analysis
+        result, summary = await asyncio.to_thread(
+            profile_analysis, _analyze, code, cpu=mode != "memory", memory=mode != "cpu")
+    return dict(result, profile=summary)
+
+@app.post("/analyze/batch")
+async def analyze_batch(request: Request):
+    """Analyzes many files: a JSON BatchInput, or a zip/tar archive as the raw body.
+
+    Streams one NDJSON line per file as results complete, then a final
+    {"summary": ...} line with the project totals.
+    """
+    body = await request.body()
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            batch = BatchInput(**json.loads(body))
+        except (ValueError, ValidationError) as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        files = [(f.path, f.code) for f in batch.files]
+    else:
+        try:
+            # Decompression is CPU-bound, keep it off the event loop
+            files = await asyncio.get_running_loop().run_in_executor(None, lambda: list(iter_archive(body)))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    for _, code in files:
+        if code is not None:  # oversized archive members are reported per file by stream_batch
+            record_input("batch", code)
+    return StreamingResponse(stream_batch(files), media_type="application/x-ndjson")
+
+async def stream_batch(files):
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    # Cache lookups and stores may hit SQLite, so they run on a thread like the archive decoding
+    results, missing = await loop.run_in_executor(None, split_cached, files)
+    for result in results:
+        yield json.dumps(result) + "\n"
+    pending = [loop.run_in_executor(pool, analyze_files, chunk) for chunk in chunked(missing)]
+    for future in asyncio.as_completed(pending):
+        for result in await loop.run_in_executor(None, cache_results, await future):
+            results.append(result)
+            yield json.dumps(result) + "\n"
+    yield json.dumps({"summary": summarize(results)}) + "\n"
+
+@app.post("/sessions")
+def open_session(input: CodeInput):
+    """Starts an incremental session for live editing. Returns its id, version 0 and the first result."""
+    record_input("sessions", input.code)
+    session = SESSIONS.open(input.code)
+    return {"session": session.id, "version": session.version, "result": session.result()}
+
+@app.post("/sessions/{session_id}/edits")
+def edit_session(session_id: str, input: EditInput):
+    """Applies edits made against the given version; only the top-level blocks they touch are re-analyzed."""
+    try:
+        session = SESSIONS.get(session_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    with session.lock:
+        try:
+            result = session.edit(input.version, [edit.model_dump() for edit in input.edits])
+        except VersionMismatch as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        return {"session": session.id, "version": session.version, "result": result}
+
+@app.delete("/sessions/{session_id}")
+def close_session(session_id: str):
+    if not SESSIONS.close(session_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return {"closed": session_id}
+
+@app.get("/cache")
+def cache_stats():
+    return RESULT_CACHE.stats()
+
+@app.get("/serving")
+def serving_stats():
+    return SERVICE.stats()
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.expose(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 def health_check():
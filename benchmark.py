@@ -0,0 +1,177 @@
+import gc
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Timer:
+    """Times a code snippet the way timeit does, but keeps every sample.
+
+    Each sample runs setup once (untimed), then the compiled snippet `number` times
+    back to back. number is calibrated so one sample lasts at least min_time, which
+    keeps perf_counter_ns resolution and loop overhead out of the result. The first
+    `warmup` samples are thrown away. The garbage collector is paused while timing.
+    """
+
+    def __init__(self, code, setup="", repeat=25, warmup=3, min_time=0.02):
+        self.code = compile(code, "<benchmark>", "exec")
+        self.setup = compile(setup, "<setup>", "exec")
+        self.repeat = repeat
+        self.warmup = warmup
+        self.min_time = min_time
+
+    def sample(self, number):
+        """Wall and CPU nanoseconds for `number` runs."""
+        scope = {"__name__": "__benchmark__"}
+        exec(self.setup, scope)
+        code = self.code
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            cpu_start = time.process_time_ns()
+            start = time.perf_counter_ns()
+            for _ in range(number):
+                exec(code, scope)
+            wall = time.perf_counter_ns() - start
+            cpu = time.process_time_ns() - cpu_start
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return wall, cpu
+
+    def calibrate(self):
+        """Smallest number in the 1, 2, 5, 10, 20, ... sequence that fills min_time."""
+        target = self.min_time * 1e9
+        number = 1
+        while True:
+            for step in (1, 2, 5):
+                wall, _ = self.sample(number * step)
+                if wall >= target:
+                    return number * step
+            number *= 10
+
+    def peak_allocation(self):
+        """Most bytes traced by tracemalloc at once during a single run, setup excluded."""
+        scope = {"__name__": "__benchmark__"}
+        exec(self.setup, scope)
+        tracemalloc.start()
+        try:
+            exec(self.code, scope)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def run(self):
+        number = self.calibrate()
+        for _ in range(self.warmup):
+            self.sample(number)
+        wall, cpu = [], []
+        for _ in range(self.repeat):
+            w, c = self.sample(number)
+            wall.append(w / number)
+            cpu.append(c / number)
+        return {"number": number, "wall_ns": wall, "cpu_ns": cpu}
+
+
+def summarize(samples, confidence=0.95):
+    """Median, quartiles and a distribution-free confidence interval for the median.
+
+    The interval comes from order statistics (binomial ranks around n/2), so it holds
+    for the skewed, long-tailed distributions timings usually have.
+    """
+    data = sorted(samples)
+    n = len(data)
+    q1, median, q3 = statistics.quantiles(data, n=4, method="inclusive") if n > 1 else data * 3
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    half = z * math.sqrt(n) / 2
+    low = max(0, math.floor(n / 2 - half) - 1) if n > 1 else 0
+    high = min(n - 1, math.ceil(n / 2 + half)) if n > 1 else 0
+    return {
+        "n": n,
+        "median": median,
+        "q1": q1,
+        "q3": q3,
+        "iqr": q3 - q1,
+        "mean": statistics.fmean(data),
+        "stdev": statistics.stdev(data) if n > 1 else 0.0,
+        "min": data[0],
+        "ci_low": data[low],
+        "ci_high": data[high],
+    }
+
+
+def speedup(baseline, candidate, confidence=0.95, resamples=2000, seed=0):
+    """Ratio of median times (baseline / candidate) with a bootstrap confidence interval."""
+    rng = random.Random(seed)
+    ratios = []
+    for _ in range(resamples):
+        b = statistics.median(rng.choices(baseline, k=len(baseline)))
+        c = statistics.median(rng.choices(candidate, k=len(candidate)))
+        ratios.append(b / c if c else math.inf)
+    ratios.sort()
+    tail = (1 - confidence) / 2
+    return {
+        "ratio": statistics.median(baseline) / statistics.median(candidate),
+        "ci_low": ratios[int(tail * resamples)],
+        "ci_high": ratios[min(resamples - 1, int((1 - tail) * resamples))],
+    }
+
+
+def compare(base, head, threshold=0.05):
+    """Lists the timings in head that got slower than in base.
+
+    Both arguments are results as written by a benchmark run ({"results": [...]}).
+    A timing counts as a regression when its median grew by more than threshold and
+    the two confidence intervals do not overlap, so noise alone does not flag it.
+    """
+    base_results = {r["id"]: r for r in base["results"]}
+    regressions = []
+    for result in head["results"]:
+        previous = base_results.get(result["id"])
+        if previous is None:
+            continue
+        for variant in ("dirty", "green"):
+            old, new = previous.get(variant), result.get(variant)
+            if not old or not new or "error" in old or "error" in new:
+                continue
+            old, new = old["wall_ns"], new["wall_ns"]
+            change = new["median"] / old["median"] - 1
+            if change > threshold and new["ci_low"] > old["ci_high"]:
+                regressions.append({
+                    "id": result["id"],
+                    "variant": variant,
+                    "base_median_ns": old["median"],
+                    "head_median_ns": new["median"],
+                    "change": round(change, 4),
+                })
+    return regressions
+
+
+def environment():
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+@contextmanager
+def scratch_dir():
+    """Runs the block inside a temporary working directory, for snippets that write files."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as path:
+        os.chdir(path)
+        try:
+            yield path
+        finally:
+            os.chdir(cwd)
@@ -0,0 +1,96 @@
+"""Scaling benchmark for the single-pass visitor in backend/engine/analyzer.py.
+
+Compares analyze_code against the previous ast.walk implementation, which
+re-walked every loop to find nested loops, on synthetic deeply nested and
+wide inputs. Suggestions must be identical; energy, CO2 and score come from the
+calibrated cost model now and are not compared.
+
+    python benchmarks/bench_ast_engine.py
+"""
+import ast
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from engine.analyzer import _analyze as analyze_code  # uncached
+
+
+def legacy_analyze_code(code):
+    tree = ast.parse(code)
+    operations = 0
+    suggestions = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.For, ast.While)):
+            operations += 500
+            suggestions.append('Consider minimizing loops or using vectorized operations (e.g., NumPy)')
+        if isinstance(node, ast.Call):
+            operations += 50
+            if isinstance(node.func, ast.Name) and node.func.id == 'range':
+                if len(node.args) == 1 and isinstance(node.args[0], ast.Call):
+                    if isinstance(node.args[0].func, ast.Name) and node.args[0].func.id == 'len':
+                        suggestions.append('Use direct iteration instead of range(len(x))')
+        if isinstance(node, ast.ListComp):
+            operations += 200
+        if isinstance(node, (ast.For, ast.While)):
+            for child in ast.walk(node):
+                if child != node and isinstance(child, (ast.For, ast.While)):
+                    suggestions.append('Detected nested loops. This can exponentially increase energy consumption.')
+    energy = round(operations * 0.00002, 4)
+    return {
+        'energy': energy,
+        'co2': round(energy * 0.475, 4),
+        'score': max(100 - int(operations / 50), 30),
+        'suggestions': list(set(suggestions)),
+    }
+
+
+def nested(depth, body_lines):
+    """depth nested loops, each level with body_lines statements of its own."""
+    lines = []
+    for level in range(depth):
+        indent = " " * level
+        lines.append(f"{indent}for i{level} in range(len(data)):")
+        lines.extend(f"{indent} x{level}_{n} = f(i{level}) + [v for v in data][0]" for n in range(body_lines))
+    return "\n".join(lines) + "\n" + " " * depth + "pass\n"
+
+
+def wide(functions):
+    return "\n".join(
+        f"def f{n}(data):\n    out = []\n    for x in data:\n        out.append(x ** 2)\n    return sum([y for y in out])\n"
+        for n in range(functions)
+    )
+
+
+def best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    cases = [(f"nested depth {depth}", nested(depth, 20)) for depth in (10, 25, 50, 90)]
+    cases += [(f"wide {count} defs", wide(count)) for count in (500, 2000)]
+    failures = 0
+    print(f"{'input':<20}{'nodes':>9}{'legacy':>12}{'visitor':>12}{'speedup':>10}")
+    for name, code in cases:
+        expected = legacy_analyze_code(code)
+        result = analyze_code(code)
+        if set(result['suggestions']) != set(expected['suggestions']):
+            failures += 1
+            print(f"MISMATCH in {name}")
+        nodes = sum(1 for _ in ast.walk(ast.parse(code)))
+        legacy = best_of(lambda: legacy_analyze_code(code))
+        visitor = best_of(lambda: analyze_code(code))
+        print(f"{name:<20}{nodes:>9}{legacy * 1000:>10.1f}ms{visitor * 1000:>10.1f}ms{legacy / visitor:>9.1f}x")
+    if failures:
+        sys.exit(f"{failures} input(s) changed results")
+    print("All results identical.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Per-keystroke latency of incremental sessions against full re-analysis.
+
+Types a short line, one character per edit, into a function in the middle of
+generated files of growing size. After the last keystroke the session result
+must equal a full analysis of the same text.
+
+    python benchmarks/bench_incremental.py
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from engine.analyzer import _analyze as analyze_code  # uncached
+from engine.incremental import Session
+
+TYPED = "    total += sum(x * x for x in range(len(data)))"
+
+
+def source(functions):
+    return "\n".join(
+        f"def f{n}(data):\n    out = []\n    for x in data:\n        out.append(x ** 2)\n    return sum([y for y in out])\n"
+        for n in range(functions)
+    )
+
+
+def main():
+    print(f"{'lines':>8}{'full parse':>14}{'keystroke':>12}{'speedup':>10}")
+    for functions in (50, 500, 5000):
+        code = source(functions)
+        session = Session(code)
+        line = code.count("\n") // 2 + 1
+        while not session.lines[line - 1].startswith("    return"):
+            line += 1
+        session.edit(session.version, [{"line": line, "col": 0, "end_line": line, "end_col": 0, "text": "\n"}])
+        keystrokes = []
+        for col, char in enumerate(TYPED):
+            start = time.perf_counter()
+            result = session.edit(session.version, [{"line": line, "col": col, "end_line": line, "end_col": col, "text": char}])
+            keystrokes.append(time.perf_counter() - start)
+        full = []
+        for _ in range(5):
+            start = time.perf_counter()
+            expected = analyze_code(session.text)
+            full.append(time.perf_counter() - start)
+        if any(result[field] != expected[field] for field in ("findings", "estimated_ns", "estimated_peak_bytes")):
+            sys.exit(f"Session result differs from a full analysis at {functions} functions")
+        keystroke, reparse = statistics.median(keystrokes), statistics.median(full)
+        print(f"{len(session.lines):>8}{reparse * 1000:>12.2f}ms{keystroke * 1000:>10.3f}ms{reparse / keystroke:>9.0f}x")
+    print("Session results identical to full analysis.")
+
+
+if __name__ == "__main__":
+    main()
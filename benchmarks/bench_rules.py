@@ -0,0 +1,101 @@
+"""Regression benchmark for GreenAnalyzerPro.analyze_and_fix.
+
+Checks that the anchored RuleMatcher reports exactly the hits of running every
+registry pattern over the whole source, and times both on a corpus of large
+stdlib modules, the dirty snippets and generated long-line files.
+
+    python benchmarks/bench_rules.py
+"""
+import inspect
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from green_analyzer import GreenAnalyzerPro
+
+STDLIB_MODULES = ["argparse", "inspect", "typing", "pathlib", "ast", "tarfile", "subprocess", "collections"]
+
+SNIPPETS = [
+    "total = sum([i*i for i in range(10000)])",
+    's = ""\nfor i in range(1000): s += "a"',
+    "data = list(range(10000))\nif 9999 in data: pass",
+    "data = open('test.txt').read()",
+    "for x in A:\n for y in B: pass",
+    "while True: pass",
+    "res = map(lambda x: x*2, range(10000))",
+    "def inc():\n global x; x+=1",
+    "for i, row in df.iterrows(): pass",
+    "while i < len(arr): i+=1",
+    "for i in range(len(arr)): val = arr[i]",
+    "for k in d.keys(): pass",
+    "for i in range(1000): out += large_string",
+    "for _ in range(10000): temp = a; a = b; b = temp",
+    "for _ in range(1000):\n    import math",
+    "while 1:\n if i>10000: break",
+    "for i in range(10000): l.append(i)",
+    "for i in range(10000):\n try: x=1\n except: pass",
+    "for i in range(10000): x = i ** 2",
+    "import gc\nfor _ in range(100): gc.disable()",
+]
+
+
+def build_corpus():
+    corpus = {}
+    for name in STDLIB_MODULES:
+        module = __import__(name)
+        corpus[name] = inspect.getsource(module)
+    corpus["snippets"] = "\n".join(SNIPPETS * 200)
+    # Generated code: long single-line literals full of anchors that never complete a hit
+    row = "{'for': 1, 'format': 'if x', 'while': len(y), 's = \"a\"': 0, 'open(': '+='}, "
+    corpus["long_lines"] = "\n".join("TABLE_%d = [%s]" % (i, row * 100) for i in range(10))
+    return corpus
+
+
+def reference_hits(analyzer, source):
+    return {
+        entry["id"]: [match.span() for match in entry["pattern"].finditer(source)]
+        for entry in analyzer.registry
+        if entry["pattern"].search(source)
+    }
+
+
+def reference_analyze(analyzer, source):
+    results = []
+    for entry in analyzer.registry:
+        if entry["pattern"].search(source):
+            results.append({"id": entry["id"], "green_code": entry["green"]})
+    return results
+
+
+def best_of(func, repeat=7):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    analyzer = GreenAnalyzerPro()
+    failures = 0
+    print(f"{'corpus':<14}{'lines':>8}{'search':>12}{'finditer':>12}{'matcher':>12}{'speedup':>10}")
+    for name, source in build_corpus().items():
+        expected = reference_hits(analyzer, source)
+        if analyzer.matcher.scan(source) != expected:
+            failures += 1
+            print(f"MISMATCH in {name}")
+        search = best_of(lambda: reference_analyze(analyzer, source))
+        finditer = best_of(lambda: reference_hits(analyzer, source))
+        matcher = best_of(lambda: analyzer._analyze_and_fix(source))  # uncached
+        print(f"{name:<14}{source.count(chr(10)) + 1:>8}{search * 1000:>10.2f}ms{finditer * 1000:>10.2f}ms"
+              f"{matcher * 1000:>10.2f}ms{finditer / matcher:>9.1f}x")
+    if failures:
+        sys.exit(f"{failures} corpus file(s) changed hit sets")
+    print("All hit sets identical.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Latency under a burst: the old threadpool path against AnalysisService.
+
+Fires a burst of distinct /analyze payloads (plus duplicates, as CI fleets send
+for unchanged files) at both paths and reports p50/p99 latency of the requests
+that were served, and how many the bounded path turned away with 503.
+
+    python benchmarks/bench_serving.py
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from engine.analyzer import RESULT_CACHE, _analyze
+from engine.serving import AnalysisService, Saturated
+
+BURST = 400
+DISTINCT = 200
+
+
+def payload(n):
+    return "\n".join(
+        f"def f{n}_{k}(data):\n    out = []\n    for x in data:\n        out.append(x ** 2)\n    return sum([y for y in out])\n"
+        for k in range(150)
+    )
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+async def timed(call, code):
+    start = time.perf_counter()
+    try:
+        await call(code)
+    except Saturated:
+        return None
+    return time.perf_counter() - start
+
+
+async def burst(make_call):
+    rng = random.Random(0)
+    codes = [payload(rng.randrange(DISTINCT)) for _ in range(BURST)]
+    RESULT_CACHE.clear()
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*[timed(make_call, code) for code in codes])
+    return latencies, time.perf_counter() - start
+
+
+def report(name, latencies, wall):
+    served = [l for l in latencies if l is not None]
+    print(f"{name:<28}{len(served):>7}{len(latencies) - len(served):>9}"
+          f"{percentile(served, 50) * 1000:>10.0f}ms{percentile(served, 99) * 1000:>10.0f}ms{wall:>9.2f}s")
+
+
+async def main():
+    print(f"{'path':<28}{'served':>7}{'refused':>9}{'p50':>12}{'p99':>12}{'wall':>10}")
+    # Starlette runs sync handlers with anyio's default of 40 threads
+    loop = asyncio.get_running_loop()
+    from concurrent.futures import ThreadPoolExecutor
+    threads = ThreadPoolExecutor(max_workers=40)
+    latencies, wall = await burst(lambda code: loop.run_in_executor(threads, _analyze, code))
+    report("threadpool (sync handler)", latencies, wall)
+    threads.shutdown()
+
+    for max_queue in (BURST, 32):
+        service = AnalysisService(max_queue=max_queue, timeout=60)
+        await service.analyze("pass")  # start the worker processes outside the measurement
+        latencies, wall = await burst(service.analyze)
+        report(f"service, queue {max_queue}", latencies, wall)
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""Cold-start cost of the analyzer behind the Streamlit app.
+
+Times `import green_analyzer` in fresh interpreters and checks that no
+measurement dependency (codecarbon, pandas, multiprocessing) comes with it,
+then times the first and later get_analyzer() calls and one uncached analysis.
+
+    python benchmarks/bench_startup.py
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RUNS = 9
+HEAVY = ["codecarbon", "pandas", "multiprocessing", "green_fixes", "benchmark", "energy"]
+
+PROBE = f"""
+import sys, time
+start = time.perf_counter()
+import green_analyzer
+print(time.perf_counter() - start)
+print(",".join(name for name in {HEAVY!r} if name in sys.modules))
+"""
+
+SNIPPET = "\n".join([
+    "total = sum([i*i for i in range(10000)])",
+    "for i in range(len(data)):",
+    "    y = data[i] ** 2",
+    "while 1: pass",
+] * 50)
+
+
+def cold_import():
+    timings, loaded = [], set()
+    for _ in range(RUNS):
+        out = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, capture_output=True, text=True, check=True)
+        seconds, modules = out.stdout.splitlines()
+        timings.append(float(seconds))
+        loaded.update(filter(None, modules.split(",")))
+    return statistics.median(timings), loaded
+
+
+def main():
+    seconds, loaded = cold_import()
+    print(f"import green_analyzer    {seconds * 1000:>8.2f}ms  (median of {RUNS} fresh interpreters)")
+    print(f"measurement modules      {', '.join(sorted(loaded)) or 'none'}")
+
+    from green_analyzer import get_analyzer
+    start = time.perf_counter()
+    analyzer = get_analyzer()
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(1000):
+        get_analyzer()
+    cached = (time.perf_counter() - start) / 1000
+    print(f"get_analyzer() first     {first * 1000:>8.3f}ms")
+    print(f"get_analyzer() cached    {cached * 1e6:>8.3f}us")
+
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        analyzer._analyze_and_fix(SNIPPET)
+        timings.append(time.perf_counter() - start)
+    print(f"analysis, {SNIPPET.count(chr(10)) + 1} lines       {statistics.median(timings) * 1000:>8.3f}ms  (uncached)")
+    if loaded:
+        sys.exit("green_analyzer imports measurement modules at startup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import functools
+import glob
+import importlib.util
+import os
+import re
+
+# Grams of CO2 per kWh (global average, the same figure the static engine uses) and
+# the power a busy core draws, for the estimators that do not measure it
+CARBON_INTENSITY = float(os.environ.get("GREENCODE_CARBON_INTENSITY", "475"))
+TDP_WATTS = float(os.environ.get("GREENCODE_TDP_WATTS", "15"))
+RAPL_ROOT = "/sys/class/powercap"
+
+# Tried in order by the "auto" backend
+AUTO_ORDER = ("rapl", "codecarbon", "tdp")
+
+BACKENDS = {}
+
+
+def backend(name):
+    """Registers a Meter subclass under name."""
+    def register(cls):
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+    return register
+
+
+class Meter:
+    """Measures the energy of one sandboxed run: start() before it, stop(cpu_time_sec) after.
+
+    Backends define stop, which returns {"energy_kwh": ..., "emissions_kg": ...};
+    energy_kwh is None when the backend only reports emissions.
+    """
+
+    name = None
+
+    @classmethod
+    def available(cls):
+        return True
+
+    def start(self):
+        pass
+
+
+def _result(kwh):
+    return {"energy_kwh": kwh, "emissions_kg": kwh * CARBON_INTENSITY / 1000}
+
+
+@backend("tdp")
+class TdpMeter(Meter):
+    """CPU time of the run (from the sandbox worker's process clock) times TDP_WATTS."""
+
+    def __init__(self, watts=None):
+        self.watts = watts or TDP_WATTS
+
+    def stop(self, cpu_time_sec=0.0):
+        return _result(cpu_time_sec * self.watts / 3.6e6)
+
+
+@backend("rapl")
+class RaplMeter(Meter):
+    """Package energy counters from Linux powercap (Intel and AMD RAPL).
+
+    The counters cover the whole package, so other load on the machine during the run
+    is counted too. Most distributions make them readable by root only.
+    """
+
+    @staticmethod
+    def domains():
+        # intel-rapl:0 is a package; intel-rapl:0:0 and the like are parts of it
+        return [
+            path for path in sorted(glob.glob(os.path.join(RAPL_ROOT, "intel-rapl:*")))
+            if re.fullmatch(r"intel-rapl:\d+", os.path.basename(path))
+            and os.access(os.path.join(path, "energy_uj"), os.R_OK)
+        ]
+
+    @classmethod
+    def available(cls):
+        return bool(cls.domains())
+
+    def start(self):
+        self._domains = self.domains()
+        self._start = [_read_uj(domain, "energy_uj") for domain in self._domains]
+
+    def stop(self, cpu_time_sec=0.0):
+        total = 0
+        for domain, start in zip(self._domains, self._start):
+            end = _read_uj(domain, "energy_uj")
+            if end < start:  # the counter wrapped around
+                end += _read_uj(domain, "max_energy_range_uj")
+            total += end - start
+        return _result(total / 1e6 / 3.6e6)
+
+
+def _read_uj(domain, name):
+    with open(os.path.join(domain, name)) as f:
+        return int(f.read())
+
+
+@backend("codecarbon")
+class CodecarbonMeter(Meter):
+    """codecarbon's EmissionsTracker. Imported on first use: it pulls in pandas and probes the hardware."""
+
+    @classmethod
+    def available(cls):
+        return importlib.util.find_spec("codecarbon") is not None
+
+    def start(self):
+        from codecarbon import EmissionsTracker
+        self._tracker = EmissionsTracker(measure_power_secs=1, save_to_file=False, log_level='error')
+        self._tracker.start()
+
+    def stop(self, cpu_time_sec=0.0):
+        emissions = self._tracker.stop()
+        data = getattr(self._tracker, "final_emissions_data", None)
+        return {"energy_kwh": getattr(data, "energy_consumed", None), "emissions_kg": emissions or 0}
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_backend(name):
+    """The Meter class for name; "auto" is the first available backend in AUTO_ORDER."""
+    if name == "auto":
+        return next(BACKENDS[candidate] for candidate in AUTO_ORDER if BACKENDS[candidate].available())
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown energy backend {name!r}, expected auto or one of {', '.join(BACKENDS)}") from None
+
+
+def get_meter(name=None):
+    """A new Meter for name, or for GREENCODE_ENERGY_BACKEND (default "auto")."""
+    return resolve_backend(name or os.environ.get("GREENCODE_ENERGY_BACKEND", "auto"))()
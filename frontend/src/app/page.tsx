@@ -172,6 +172,13 @@ export default function Home() {
                         unit="grams"
                         color="blue"
                       />
+                      <MetricCard
+                        icon={<BarChart3 className="w-5 h-5" />}
+                        title="Peak Memory (est.)"
+                        value={`${(result.estimated_peak_bytes / 1024).toFixed(1)}`}
+                        unit="KB"
+                        color="purple"
+                      />
                     </div>
                   </div>
 
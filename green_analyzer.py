@@ -1,65 +1,270 @@
 import re
-import time
 import hashlib
+import json
+import statistics
 import threading
-from codecarbon import EmissionsTracker
+from bisect import bisect_right
+from itertools import accumulate, count
+from operator import add
+from backend.engine.cache import cache_from_env
+
+
+# Shared by every GreenAnalyzerPro, so results outlive the analyzer instance
+RESULT_CACHE = cache_from_env()
+
+# Lines longer than this make `.*` patterns backtrack once per anchor on the line
+LONG_LINE = 1000
+
+
+class RuleMatcher:
+    """Finds every hit of every registry rule, with spans.
+
+    A rule is skipped outright when a literal it requires is missing from the source.
+    Rules with several anchors, and `anchor.*rest` rules on sources with long lines,
+    are only attempted where an anchor occurs; everything else is left to the C-level
+    ``finditer``. Either way the hits are exactly those of ``pattern.finditer(source)``.
+    """
+
+    def __init__(self, registry):
+        self.rules = []
+        for entry in registry:
+            anchors = [re.compile(anchor) for anchor in entry["anchors"]]
+            self.rules.append((entry, anchors))
+
+    def scan(self, source):
+        """Returns {rule id: [(start, end), ...]} for every rule that hits."""
+        hits = {}
+        long_lines = None
+        for entry, anchors in self.rules:
+            if not all(literal in source for literal in entry["requires"]):
+                continue
+            anchored = len(anchors) > 1
+            if entry["skip_line"]:
+                if long_lines is None:
+                    long_lines = max(map(len, source.split("\n"))) > LONG_LINE
+                anchored = long_lines
+            if anchored:
+                spans = self._find(entry["pattern"], anchors, entry["skip_line"], source)
+            else:
+                spans = [match.span() for match in entry["pattern"].finditer(source)]
+            if spans:
+                hits[entry["id"]] = spans
+        return hits
+
+    @staticmethod
+    def _find(pattern, anchors, skip_line, source):
+        spans = []
+        pending = [anchor.search(source) for anchor in anchors]
+        pos = 0
+        line_end = -1
+        while True:
+            # Next anchor occurrence at or after pos, across all anchors of the rule
+            found = None
+            for i, anchor in enumerate(anchors):
+                if pending[i] is not None and pending[i].start() < pos:
+                    pending[i] = anchor.search(source, pos)
+                if pending[i] is not None and (found is None or pending[i].start() < found.start()):
+                    found = pending[i]
+            if found is None:
+                return spans
+            start = found.start()
+            single_line = "\n" not in found.group()
+            # For `anchor.*rest` patterns a failed attempt means no later anchor on the
+            # same line can hit either: its `.*` would be a suffix of ours.
+            if start < line_end and single_line:
+                pos = start + 1
+                continue
+            match = pattern.match(source, start)
+            if match:
+                spans.append(match.span())
+                pos = match.end()
+                line_end = -1
+            else:
+                pos = start + 1
+                if skip_line and single_line:
+                    line_end = source.find("\n", start)
+                    if line_end < 0:
+                        return spans
+
+    @staticmethod
+    def locate(source, hits):
+        """Converts the offsets from scan() to 1-based lines and 0-based columns."""
+        # Offset just past the newline of every line, built without a Python-level loop
+        line_ends = list(map(add, accumulate(map(len, source.split("\n"))), count(1)))
+        located = {}
+        for rule_id, spans in hits.items():
+            located[rule_id] = []
+            for start, end in spans:
+                line = bisect_right(line_ends, start)
+                end_line = bisect_right(line_ends, end)
+                located[rule_id].append({
+                    "line": line + 1,
+                    "col": start - (line_ends[line - 1] if line else 0),
+                    "end_line": end_line + 1,
+                    "end_col": end - (line_ends[end_line - 1] if end_line else 0),
+                })
+        return located
+
+
+# 20 Golden Rules for Code Optimization
+# "anchors" are the regexes every hit starts with, "requires" are literals every hit
+# contains and "skip_line" marks patterns shaped like `anchor.*rest` (see RuleMatcher)
+REGISTRY = [
+    {"id": "gen_exp", "pattern": re.compile(r"sum\(\[.*for.*in.*\]\)"), "anchors": [r"sum\(\["], "requires": ["])"], "skip_line": True, "green": "Use generator: sum(x for x in data)"},
+    {"id": "str_concat", "pattern": re.compile(r"s\s*=\s*['\"].*['\"].*s\s*\+=\s*.*"), "anchors": [r"s\s*=\s*['\"]"], "requires": ["+="], "skip_line": True, "green": "Use ''.join(list) instead of +="},
+    {"id": "set_lookup", "pattern": re.compile(r"if\s+.*\s+in\s+.*list"), "anchors": [r"if\s+"], "requires": ["in", "list"], "skip_line": True, "green": "Convert list to set() for O(1) lookup"},
+    {"id": "file_stream", "pattern": re.compile(r"open\(.*\)\.read\(\)"), "anchors": [r"open\("], "requires": [").read()"], "skip_line": True, "green": "Use streaming: with open() as f: for line in f:"},
+    {"id": "nested_loops", "pattern": re.compile(r"for.*:\s*\n?\s*for.*:"), "anchors": [r"for"], "requires": [], "skip_line": True, "green": "Use HashMaps/Sets to reduce complexity to O(n)"},
+    {"id": "busy_wait", "pattern": re.compile(r"while\s+True:\s*pass"), "anchors": [r"while"], "requires": ["True:", "pass"], "skip_line": False, "green": "Use time.sleep() to reduce CPU cycles"},
+    {"id": "map_filt", "pattern": re.compile(r"map\(lambda|filter\(lambda"), "anchors": [r"map\(lambda", r"filter\(lambda"], "requires": ["(lambda"], "skip_line": False, "green": "Use list comprehensions"},
+    {"id": "global_ref", "pattern": re.compile(r"global\s+\w+"), "anchors": [r"global"], "requires": [], "skip_line": False, "green": "Use local variables instead of globals"},
+    {"id": "df_iter", "pattern": re.compile(r"\.iterrows\(\)"), "anchors": [r"\.iterrows\(\)"], "requires": [], "skip_line": False, "green": "Use .itertuples() for Pandas iteration"},
+    {"id": "len_cache", "pattern": re.compile(r"while.*len\(.*\):"), "anchors": [r"while"], "requires": ["len(", "):"], "skip_line": True, "green": "Cache len() in a variable before the loop"},
+    {"id": "enum_opt", "pattern": re.compile(r"range\(len\(.*\)\)"), "anchors": [r"range\(len\("], "requires": ["))"], "skip_line": True, "green": "Use enumerate()"},
+    {"id": "dict_keys", "pattern": re.compile(r"\.keys\(\)"), "anchors": [r"\.keys\(\)"], "requires": [], "skip_line": False, "green": "Check 'if k in d' directly"},
+    {"id": "string_io", "pattern": re.compile(r"\+=.*large_string"), "anchors": [r"\+="], "requires": ["large_string"], "skip_line": True, "green": "Use io.StringIO"},
+    {"id": "tuple_swap", "pattern": re.compile(r"temp\s*=\s*a;\s*a\s*=\s*b"), "anchors": [r"temp"], "requires": [], "skip_line": False, "green": "Use 'a, b = b, a'"},
+    {"id": "imp_loop", "pattern": re.compile(r"for.*:\s*\n?\s*import"), "anchors": [r"for"], "requires": ["import"], "skip_line": True, "green": "Move imports to top of file"},
+    {"id": "while_one", "pattern": re.compile(r"while\s+1:"), "anchors": [r"while"], "requires": ["1:"], "skip_line": False, "green": "Use 'while True'"},
+    {"id": "list_ext", "pattern": re.compile(r"for.*append"), "anchors": [r"for"], "requires": ["append"], "skip_line": True, "green": "Use .extend()"},
+    {"id": "try_loop", "pattern": re.compile(r"for.*:\s*\n?\s*try:"), "anchors": [r"for"], "requires": ["try:"], "skip_line": True, "green": "Move try/except outside the loop"},
+    {"id": "pow_opt", "pattern": re.compile(r"\*\* 2"), "anchors": [r"\*\* 2"], "requires": [], "skip_line": False, "green": "Use 'x * x'"},
+    {"id": "gc_man", "pattern": re.compile(r"gc\.disable"), "anchors": [r"gc\.disable"], "requires": [], "skip_line": False, "green": "Enable gc.collect() manually"}
+]
+MATCHER = RuleMatcher(REGISTRY)
+# Any edit to a registry entry (pattern, id, suggestion or matcher hints) changes the
+# version and so every cache key, in memory and in the SQLite tier
+RULESET_VERSION = hashlib.sha256(json.dumps(
+    [dict(entry, pattern=[entry["pattern"].pattern, entry["pattern"].flags]) for entry in REGISTRY],
+    sort_keys=True,
+).encode()).hexdigest()[:16]
+
 
 class GreenAnalyzerPro:
-    def __init__(self, ai_client=None):
+    def __init__(self, ai_client=None, cache=None, sandbox=None, energy=None):
         self.ai_client = ai_client  
-        self.ai_cache = {}  
-       # 20 Golden Rules for Code Optimization
-        self.registry = [
-            {"id": "gen_exp", "pattern": re.compile(r"sum\(\[.*for.*in.*\]\)"), "green": "Use generator: sum(x for x in data)"},
-            {"id": "str_concat", "pattern": re.compile(r"s\s*=\s*['\"].*['\"].*s\s*\+=\s*.*"), "green": "Use ''.join(list) instead of +="},
-            {"id": "set_lookup", "pattern": re.compile(r"if\s+.*\s+in\s+.*list"), "green": "Convert list to set() for O(1) lookup"},
-            {"id": "file_stream", "pattern": re.compile(r"open\(.*\)\.read\(\)"), "green": "Use streaming: with open() as f: for line in f:"},
-            {"id": "nested_loops", "pattern": re.compile(r"for.*:\s*\n?\s*for.*:"), "green": "Use HashMaps/Sets to reduce complexity to O(n)"},
-            {"id": "busy_wait", "pattern": re.compile(r"while\s+True:\s*pass"), "green": "Use time.sleep() to reduce CPU cycles"},
-            {"id": "map_filt", "pattern": re.compile(r"map\(lambda|filter\(lambda"), "green": "Use list comprehensions"},
-            {"id": "global_ref", "pattern": re.compile(r"global\s+\w+"), "green": "Use local variables instead of globals"},
-            {"id": "df_iter", "pattern": re.compile(r"\.iterrows\(\)"), "green": "Use .itertuples() for Pandas iteration"},
-            {"id": "len_cache", "pattern": re.compile(r"while.*len\(.*\):"), "green": "Cache len() in a variable before the loop"},
-            {"id": "enum_opt", "pattern": re.compile(r"range\(len\(.*\)\)"), "green": "Use enumerate()"},
-            {"id": "dict_keys", "pattern": re.compile(r"\.keys\(\)"), "green": "Check 'if k in d' directly"},
-            {"id": "string_io", "pattern": re.compile(r"\+=.*large_string"), "green": "Use io.StringIO"},
-            {"id": "tuple_swap", "pattern": re.compile(r"temp\s*=\s*a;\s*a\s*=\s*b"), "green": "Use 'a, b = b, a'"},
-            {"id": "imp_loop", "pattern": re.compile(r"for.*:\s*\n?\s*import"), "green": "Move imports to top of file"},
-            {"id": "while_one", "pattern": re.compile(r"while\s+1:"), "green": "Use 'while True'"},
-            {"id": "list_ext", "pattern": re.compile(r"for.*append"), "green": "Use .extend()"},
-            {"id": "try_loop", "pattern": re.compile(r"for.*:\s*\n?\s*try:"), "green": "Move try/except outside the loop"},
-            {"id": "pow_opt", "pattern": re.compile(r"\*\* 2"), "green": "Use 'x * x'"},
-            {"id": "gc_man", "pattern": re.compile(r"gc\.disable"), "green": "Enable gc.collect() manually"}
-        ]
-
-    def measure_efficiency(self, code_func, timeout_sec=5):
-        tracker = EmissionsTracker(measure_power_secs=1, save_to_file=False, log_level='error')
+        self.cache = cache if cache is not None else RESULT_CACHE
+        self.sandbox = sandbox  # defaults to the shared pool, started on first measurement
+        self.energy = energy  # backend name for energy.get_meter, default GREENCODE_ENERGY_BACKEND
+        self.registry = REGISTRY
+        self.matcher = MATCHER
+        self.ruleset_version = RULESET_VERSION
+
+    def measure_efficiency(self, code, timeout_sec=5, restricted=False, trace_memory=False):
+        """Runs code in the sandbox pool and reports duration, CPU time, peak RSS and emissions.
+
+        restricted=True executes it with sandbox.SAFE_BUILTINS only. trace_memory=True adds the peak
+        traced allocation (peak_alloc_kb) from a second, untimed run. Energy comes from
+        the backend named by self.energy (see energy.py).
+        """
+        # Measurement modules load on first use so static analysis never pays for them
+        from energy import get_meter
+        from sandbox import get_pool
         try:
-            tracker.start()
-            start_time = time.time()
-            def run():
-                try: 
-                    code_func()
-                except Exception as e: 
-                    pass
-            thread = threading.Thread(target=run)
-            thread.daemon = True
-            thread.start()
-            thread.join(timeout_sec)
-            
-            # If thread is still alive after join, it timed out
-            if thread.is_alive():
-                tracker.stop()
-                return {"error": "Timeout"}
-
-            emissions = tracker.stop()
-            return {"duration_sec": time.time() - start_time, "emissions_kg": emissions if emissions else 0}
+            meter = get_meter(self.energy)
+            meter.start()
+            sandbox = self.sandbox if self.sandbox is not None else get_pool()
+            metrics = sandbox.run(code, timeout_sec=timeout_sec, restricted=restricted, trace_memory=trace_memory)
+            energy = meter.stop(metrics.get("cpu_time_sec", 0))
+            if "error" in metrics:
+                return {"error": metrics["error"]}
+            metrics.update(energy, energy_backend=meter.name)
+            return metrics
         except Exception as e: 
             return {"error": str(e)}
 
+    def compare_fix(self, code, rounds=7, timeout_sec=5, restricted=False):
+        """Rewrites code with the mechanical fixes and times both versions in the sandbox.
+
+        Original and fixed runs alternate for `rounds` rounds so drift hits both alike.
+        Returns the fixed code, the fixes applied, both timing summaries, the speedup
+        with a bootstrap confidence interval, the peak RSS and peak allocation deltas
+        and the CO2 saved per run. CO2 is the emissions of the whole comparison, as
+        measured by the energy backend, shared out by CPU time. Allocations are traced
+        in the first round only. The first round of both versions must raise the same
+        exception, print the same output and leave the same values in the globals
+        they share, or the comparison is refused as not equivalent.
+        """
+        from benchmark import speedup, summarize
+        from energy import get_meter
+        from green_fixes import apply_fixes
+        from sandbox import get_pool
+        try:
+            fixed, applied = apply_fixes(code)
+        except SyntaxError as e:
+            return {"error": f"SyntaxError: {e.msg} (line {e.lineno})"}
+        if not applied:
+            return {"error": "No mechanical fix applies to this code"}
+        sandbox = self.sandbox if self.sandbox is not None else get_pool()
+        runs = {"original": [], "fixed": []}
+        try:
+            meter = get_meter(self.energy)
+            meter.start()
+            for round_index in range(rounds):
+                for variant, source in (("original", code), ("fixed", fixed)):
+                    metrics = sandbox.run(source, timeout_sec=timeout_sec, restricted=restricted,
+                                          trace_memory=round_index == 0, fingerprint=round_index == 0)
+                    if "error" in metrics:
+                        meter.stop()
+                        return {"error": f"{variant}: {metrics['error']}"}
+                    runs[variant].append(metrics)
+            emissions = meter.stop(sum(m["cpu_time_sec"] for metrics in runs.values() for m in metrics))["emissions_kg"]
+        except Exception as e:
+            return {"error": str(e)}
+        first = {variant: metrics[0] for variant, metrics in runs.items()}
+        original, fixed_outcome = (first[variant].get("exception") for variant in ("original", "fixed"))
+        if original != fixed_outcome:
+            return {"error": f"Fixed code behaves differently: {original or 'no exception'} vs {fixed_outcome or 'no exception'}"}
+        if first["original"]["stdout_sha256"] != first["fixed"]["stdout_sha256"]:
+            return {"error": "Fixed code behaves differently: it prints different output"}
+        # Names only one version binds (the fixes add item names and drop temps) are not compared
+        shared = first["original"]["globals"].keys() & first["fixed"]["globals"].keys()
+        changed = sorted(name for name in shared if first["original"]["globals"][name] != first["fixed"]["globals"][name])
+        if changed:
+            return {"error": f"Fixed code behaves differently: different final values of {', '.join(changed)}"}
+
+        wall = {variant: [m["duration_sec"] for m in metrics] for variant, metrics in runs.items()}
+        cpu = {variant: [m["cpu_time_sec"] for m in metrics] for variant, metrics in runs.items()}
+        rss = {variant: [m["peak_rss_kb"] for m in metrics if m.get("peak_rss_kb") is not None] for variant, metrics in runs.items()}
+        total_cpu = sum(cpu["original"]) + sum(cpu["fixed"])
+        kg_per_cpu_sec = emissions / total_cpu if total_cpu else 0
+        alloc = {variant: metrics[0].get("peak_alloc_kb") for variant, metrics in runs.items()}
+        cpu_saved = statistics.median(cpu["original"]) - statistics.median(cpu["fixed"])
+        return {
+            "fixed_code": fixed,
+            "applied": applied,
+            "rounds": rounds,
+            "original": {"wall_sec": summarize(wall["original"]), "cpu_sec": summarize(cpu["original"])},
+            "fixed": {"wall_sec": summarize(wall["fixed"]), "cpu_sec": summarize(cpu["fixed"])},
+            "speedup": speedup(wall["original"], wall["fixed"]),
+            "peak_rss_delta_kb": statistics.median(rss["fixed"]) - statistics.median(rss["original"]) if rss["original"] and rss["fixed"] else None,
+            "peak_alloc_kb": alloc,
+            "peak_alloc_delta_kb": alloc["fixed"] - alloc["original"] if None not in alloc.values() else None,
+            "emissions_kg": emissions,
+            "energy_backend": meter.name,
+            "co2_saved_kg_per_run": cpu_saved * kg_per_cpu_sec,
+        }
+
     def analyze_and_fix(self, user_code):
+        return self.cache.get_or_compute(user_code, self.ruleset_version, "analyze_and_fix", self._analyze_and_fix)
+
+    def _analyze_and_fix(self, user_code):
+        hits = self.matcher.locate(user_code, self.matcher.scan(user_code))
         results = []
         for entry in self.registry:
-            if entry["pattern"].search(user_code):
-                results.append({"id": entry["id"], "green_code": entry["green"]})
+            if entry["id"] in hits:
+                results.append({"id": entry["id"], "green_code": entry["green"], "spans": hits[entry["id"]]})
         return results
+
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def get_analyzer():
+    """Shared analyzer, created on first use. Measurement backends load on first measurement."""
+    global _analyzer
+    with _analyzer_lock:
+        if _analyzer is None:
+            _analyzer = GreenAnalyzerPro()
+        return _analyzer
@@ -0,0 +1,275 @@
+import ast
+from collections import Counter
+
+from backend.engine.rules import is_swap
+
+
+class _Fix(ast.NodeTransformer):
+    """Rewrites one dirty pattern; `applied` counts the rewrites made.
+
+    Fixes are syntactic and assume the operands are built-in types: they skip hits
+    whose rewrite would change behaviour for those (for example `f(x) ** 2`, which
+    would call f twice), but cannot see what a name holds at run time.
+    """
+
+    rule_id = None
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.applied = 0
+
+
+class GeneratorFix(_Fix):
+    """sum([x for x in data]) -> sum(x for x in data)"""
+
+    rule_id = "gen_exp"
+    # Functions that consume the whole iterable, so laziness cannot skip side effects
+    CONSUMERS = {"sum", "min", "max"}
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if (isinstance(node.func, ast.Name) and node.func.id in self.CONSUMERS and len(node.args) == 1
+                and not node.keywords and isinstance(node.args[0], ast.ListComp)):
+            comp = node.args[0]
+            node.args[0] = ast.copy_location(ast.GeneratorExp(elt=comp.elt, generators=comp.generators), comp)
+            self.applied += 1
+        return node
+
+
+class PowerFix(_Fix):
+    """x ** 2 -> x * x, for plain names and an int exponent (x ** 2.0 returns a float)."""
+
+    rule_id = "pow_opt"
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if (isinstance(node.op, ast.Pow) and isinstance(node.left, ast.Name)
+                and isinstance(node.right, ast.Constant) and type(node.right.value) is int and node.right.value == 2):
+            self.applied += 1
+            return ast.copy_location(ast.BinOp(left=node.left, op=ast.Mult(), right=ast.Name(node.left.id, ast.Load())), node)
+        return node
+
+
+class WhileTrueFix(_Fix):
+    """while 1: -> while True:"""
+
+    rule_id = "while_one"
+
+    def visit_While(self, node):
+        self.generic_visit(node)
+        if isinstance(node.test, ast.Constant) and node.test.value == 1 and node.test.value is not True:
+            node.test = ast.copy_location(ast.Constant(True), node.test)
+            self.applied += 1
+        return node
+
+
+class DictKeysFix(_Fix):
+    """for k in d.keys() -> for k in d, and k in d.keys() -> k in d
+
+    Fires on any .keys() call without arguments, so it is only safe where the object is
+    a dict (or a mapping whose keys() agrees with its iteration and membership test).
+    """
+
+    rule_id = "dict_keys"
+
+    def visit_For(self, node):
+        self.generic_visit(node)
+        node.iter = self._unwrap(node.iter)
+        return node
+
+    def visit_comprehension(self, node):
+        self.generic_visit(node)
+        node.iter = self._unwrap(node.iter)
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        node.comparators = [
+            self._unwrap(right) if isinstance(op, (ast.In, ast.NotIn)) else right
+            for op, right in zip(node.ops, node.comparators)
+        ]
+        return node
+
+    def _unwrap(self, node):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "keys"
+                and not node.args and not node.keywords):
+            self.applied += 1
+            return node.func.value
+        return node
+
+
+class EnumerateFix(_Fix):
+    """for i in range(len(seq)): ... seq[i] ... -> for i, item in enumerate(seq): ... item ...
+
+    Only when seq is a name and the body uses it for subscript reads alone: no assignment
+    to i, seq or any seq[...], no method call on seq and no passing it anywhere, since
+    enumerate sees the list change while range(len(seq)) was fixed up front.
+    """
+
+    rule_id = "enum_opt"
+
+    def __init__(self, tree):
+        super().__init__(tree)
+        self.names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+
+    def visit_For(self, node):
+        self.generic_visit(node)
+        if node.orelse or not isinstance(node.target, ast.Name):
+            return node
+        call = node.iter
+        if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Name) and call.func.id == "range"
+                and len(call.args) == 1 and not call.keywords):
+            return node
+        length = call.args[0]
+        if not (isinstance(length, ast.Call) and isinstance(length.func, ast.Name) and length.func.id == "len"
+                and len(length.args) == 1 and isinstance(length.args[0], ast.Name)):
+            return node
+        index, seq = node.target.id, length.args[0].id
+        reads, subscripted, uses = [], set(), []
+        for stmt in node.body:
+            for child in ast.walk(stmt):
+                if isinstance(child, ast.Name) and child.id in (index, seq):
+                    if not isinstance(child.ctx, ast.Load):
+                        return node
+                    if child.id == seq:
+                        uses.append(child)
+                if isinstance(child, ast.Subscript) and isinstance(child.value, ast.Name) and child.value.id == seq:
+                    if not isinstance(child.ctx, ast.Load):
+                        return node
+                    subscripted.add(id(child.value))
+                    if isinstance(child.slice, ast.Name) and child.slice.id == index:
+                        reads.append(child)
+        # Any other use of seq (seq.insert(...), f(seq), alias = seq) may change its length
+        if not reads or any(id(use) not in subscripted for use in uses):
+            return node
+        item = self._fresh_name(f"{seq}_item")
+        node.body = [_ReplaceReads(reads, item).visit(stmt) for stmt in node.body]
+        node.target = ast.Tuple([ast.Name(index, ast.Store()), ast.Name(item, ast.Store())], ast.Store())
+        node.iter = ast.Call(ast.Name("enumerate", ast.Load()), [ast.Name(seq, ast.Load())], [])
+        self.applied += 1
+        return node
+
+    def _fresh_name(self, base):
+        name, n = base, 1
+        while name in self.names:
+            n += 1
+            name = f"{base}{n}"
+        self.names.add(name)
+        return name
+
+
+class _ReplaceReads(ast.NodeTransformer):
+    def __init__(self, reads, name):
+        self.reads = {id(node) for node in reads}
+        self.name = name
+
+    def visit_Subscript(self, node):
+        if id(node) in self.reads:
+            return ast.copy_location(ast.Name(self.name, ast.Load()), node)
+        return self.generic_visit(node)
+
+
+class ExtendFix(_Fix):
+    """for x in it: out.append(f(x)) -> out.extend(f(x) for x in it)
+
+    Only single-statement loops over a plain name target that is not read anywhere
+    else, since the rewrite no longer leaves x bound after the loop.
+    """
+
+    rule_id = "list_ext"
+
+    def __init__(self, tree):
+        super().__init__(tree)
+        self.loads = Counter(node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load))
+
+    def visit_For(self, node):
+        self.generic_visit(node)
+        if node.orelse or len(node.body) != 1 or not isinstance(node.target, ast.Name):
+            return node
+        stmt = node.body[0]
+        if not (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call)):
+            return node
+        call = stmt.value
+        if not (isinstance(call.func, ast.Attribute) and call.func.attr == "append"
+                and len(call.args) == 1 and not call.keywords and isinstance(call.func.value, ast.Name)):
+            return node
+        target = node.target.id
+        inside = sum(isinstance(child, ast.Name) and child.id == target and isinstance(child.ctx, ast.Load)
+                     for child in ast.walk(call))
+        target_list = call.func.value.id
+        if (target_list == target or self.loads[target] != inside
+                or any(isinstance(child, ast.Name) and child.id == target_list for child in ast.walk(node.iter))):
+            return node
+        value = call.args[0]
+        if isinstance(value, ast.Name) and value.id == target:
+            argument = node.iter
+        else:
+            argument = ast.GeneratorExp(value, [ast.comprehension(node.target, node.iter, [], 0)])
+        extend = ast.Attribute(ast.Name(target_list, ast.Load()), "extend", ast.Load())
+        self.applied += 1
+        return ast.copy_location(ast.Expr(ast.Call(extend, [argument], [])), node)
+
+
+class SwapFix(_Fix):
+    """temp = a; a = b; b = temp -> a, b = b, a, dropping temp when nothing else reads it."""
+
+    rule_id = "tuple_swap"
+
+    def __init__(self, tree):
+        super().__init__(tree)
+        self.loads = Counter(node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load))
+
+    def generic_visit(self, node):
+        super().generic_visit(node)
+        for field in ("body", "orelse", "finalbody"):
+            stmts = getattr(node, field, None)
+            if isinstance(stmts, list) and stmts and isinstance(stmts[0], ast.stmt):
+                setattr(node, field, self._fix_block(stmts))
+        return node
+
+    def _fix_block(self, stmts):
+        out, i = [], 0
+        while i < len(stmts):
+            if i + 2 < len(stmts) and is_swap(*stmts[i:i + 3]):
+                first, second = stmts[i], stmts[i + 1]
+                temp, a, b = first.targets[0].id, second.targets[0].id, second.value.id
+                if self.loads[temp] > 1:
+                    out.append(first)
+                swap = ast.Assign(
+                    [ast.Tuple([ast.Name(a, ast.Store()), ast.Name(b, ast.Store())], ast.Store())],
+                    ast.Tuple([ast.Name(b, ast.Load()), ast.Name(a, ast.Load())], ast.Load()),
+                )
+                out.append(ast.copy_location(swap, second))
+                self.applied += 1
+                i += 3
+            else:
+                out.append(stmts[i])
+                i += 1
+        return out
+
+
+# Rules with a mechanical rewrite, in the order they are applied. enumerate goes first
+# so the fixes after it see seq[i] ** 2 as item ** 2.
+FIXES = [EnumerateFix, GeneratorFix, PowerFix, WhileTrueFix, DictKeysFix, ExtendFix, SwapFix]
+FIXABLE = {fix.rule_id for fix in FIXES}
+
+
+def apply_fixes(code, rule_ids=None):
+    """Rewrites code with the fixes for rule_ids (default: all of them).
+
+    Returns (fixed code, {rule id: rewrites}). The fixed code is regenerated from the
+    AST, so comments and formatting are lost; when no fix applies the original text
+    is returned as is. Raises SyntaxError for code that does not parse.
+    """
+    tree = ast.parse(code)
+    applied = {}
+    for fix in FIXES:
+        if rule_ids is not None and fix.rule_id not in rule_ids:
+            continue
+        transformer = fix(tree)
+        tree = transformer.visit(tree)
+        if transformer.applied:
+            applied[fix.rule_id] = transformer.applied
+    if not applied:
+        return code, applied
+    return ast.unparse(ast.fix_missing_locations(tree)), applied
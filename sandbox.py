@@ -0,0 +1,278 @@
+import ast
+import atexit
+import builtins
+import contextlib
+import hashlib
+import io
+import math
+import multiprocessing
+import os
+import queue
+import re
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+import types
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, timeouts still apply
+    resource = None
+
+
+# What restricted runs see as builtins: pure functions and types, no __import__,
+# open, eval, exec, compile, getattr, type or anything else that reaches outside
+SAFE_BUILTINS = {name: getattr(builtins, name) for name in (
+    "abs", "all", "any", "ascii", "bin", "bool", "bytearray", "bytes", "callable", "chr",
+    "classmethod", "complex", "dict", "divmod", "enumerate", "filter", "float", "format",
+    "frozenset", "hasattr", "hash", "hex", "int", "isinstance", "issubclass", "iter", "len",
+    "list", "map", "max", "min", "next", "object", "oct", "ord", "pow", "print", "property",
+    "range", "repr", "reversed", "round", "set", "slice", "sorted", "staticmethod", "str",
+    "sum", "super", "tuple", "zip", "__build_class__",
+    "ArithmeticError", "AssertionError", "AttributeError", "Exception", "IndexError",
+    "KeyError", "LookupError", "NameError", "NotImplementedError", "OverflowError",
+    "RuntimeError", "StopIteration", "TypeError", "ValueError", "ZeroDivisionError",
+)}
+
+# Attributes that lead from any object back to modules, frames or code, the usual way
+# out of a builtins whitelist (().__class__.__base__.__subclasses__() and the like)
+BLOCKED_ATTRIBUTES = {
+    "__class__", "__base__", "__bases__", "__mro__", "__subclasses__", "__globals__",
+    "__builtins__", "__code__", "__closure__", "__dict__", "__getattribute__", "__reduce__",
+    "__reduce_ex__", "__loader__", "__spec__", "__self__", "__func__",
+    "gi_frame", "gi_code", "cr_frame", "ag_frame", "f_globals", "f_locals", "f_back", "f_builtins", "tb_frame",
+}
+
+
+class SandboxPool:
+    """Pre-forked pool of worker processes that run untrusted snippets.
+
+    Workers stay warm between runs, so a measurement does not pay for interpreter
+    start-up. A run that outlives its timeout has its worker killed and replaced, so
+    nothing keeps spinning in the background. Each run is capped at cpu_limit_sec
+    of CPU time and each worker at memory_limit_mb of address space (where the
+    resource module exists). Workers are recycled after max_tasks runs so state
+    leaked by one snippet cannot skew later measurements for long.
+    """
+
+    def __init__(self, workers=2, cpu_limit_sec=10, memory_limit_mb=2048, max_tasks=50):
+        self.cpu_limit_sec = cpu_limit_sec
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks = max_tasks
+        self._context = multiprocessing.get_context()
+        self._idle = queue.Queue()
+        self._workers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(workers):
+            self._idle.put(self._spawn())
+
+    def run(self, code, timeout_sec=5, restricted=False, trace_memory=False, fingerprint=False):
+        """Executes code in a worker and returns its measurements.
+
+        restricted=True runs it with SAFE_BUILTINS only and refuses code that touches
+        BLOCKED_ATTRIBUTES or names starting with a double underscore.
+
+        The result has duration_sec (wall), cpu_time_sec and peak_rss_kb, plus
+        "exception" when the snippet raised. With trace_memory, the snippet runs a
+        second time under tracemalloc, after the timed run so tracing does not slow
+        it, and peak_alloc_kb gives the most Python memory it held at once. With
+        fingerprint, stdout_sha256 and globals ({name: digest of its repr}) describe
+        what the timed run printed and left behind, for comparing two versions. A
+        timeout, a CPU or memory limit hit, or a crashed worker gives {"error": ...}
+        instead; timeout_sec and the CPU limit cover both runs.
+        """
+        worker = self._idle.get()
+        try:
+            worker.conn.send((code, restricted, self.cpu_limit_sec, trace_memory, fingerprint))
+            if worker.conn.poll(timeout_sec):
+                result = worker.conn.recv()
+                worker.tasks += 1
+                if worker.tasks < self.max_tasks:
+                    self._idle.put(worker)
+                    worker = None
+                return result
+            return {"error": "Timeout"}
+        except (EOFError, OSError):
+            worker.process.join(1)
+            if worker.process.exitcode == -getattr(signal, "SIGXCPU", 0):
+                return {"error": "CPU limit exceeded"}
+            return {"error": f"Sandbox worker died (exit code {worker.process.exitcode})"}
+        finally:
+            if worker is not None:
+                self._retire(worker)
+                if not self._closed:
+                    self._idle.put(self._spawn())
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            self._retire(worker)
+
+    def _spawn(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child_conn, self.memory_limit_mb), daemon=True)
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _retire(self, worker):
+        with self._lock:
+            self._workers.discard(worker)
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join()  # reap it so no zombie is left behind
+        worker.conn.close()
+
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.tasks = 0
+
+
+def _worker_main(conn, memory_limit_mb):
+    if resource is not None and memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    while True:
+        try:
+            code, restricted, cpu_limit_sec, trace_memory, fingerprint = conn.recv()
+        except EOFError:
+            return
+        conn.send(_measure(code, restricted, cpu_limit_sec, trace_memory, fingerprint))
+
+
+def _measure(code, restricted, cpu_limit_sec, trace_memory=False, fingerprint=False):
+    if resource is not None and cpu_limit_sec:
+        # RLIMIT_CPU counts the whole life of the worker, so move the soft limit
+        # to "now + budget"; going over it delivers SIGXCPU and kills the worker.
+        used = resource.getrusage(resource.RUSAGE_SELF)
+        soft = math.ceil(used.ru_utime + used.ru_stime + cpu_limit_sec)
+        hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    if restricted:
+        problem = _restricted_problem(code)
+        if problem:
+            return {"error": problem}
+    _reset_peak_rss()
+    scope = _scope(restricted)
+    result = {}
+    stdout = io.StringIO()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(stdout):
+            exec(code, scope)
+    except MemoryError:
+        result["error"] = "Memory limit exceeded"
+    except BaseException as e:
+        result["exception"] = f"{type(e).__name__}: {e}"
+    result["duration_sec"] = time.perf_counter() - wall_start
+    result["cpu_time_sec"] = time.process_time() - cpu_start
+    result["peak_rss_kb"] = _peak_rss_kb()
+    if fingerprint and "error" not in result:
+        result["stdout_sha256"] = hashlib.sha256(stdout.getvalue().encode()).hexdigest()
+        result["globals"] = _globals_digest(scope)
+    if trace_memory and "error" not in result:
+        result["peak_alloc_kb"] = _peak_alloc_kb(code, restricted)
+    return result
+
+
+def _scope(restricted):
+    if restricted:
+        return {"__builtins__": dict(SAFE_BUILTINS), "__name__": "__sandbox__"}
+    return {"__name__": "__sandbox__"}
+
+
+def _restricted_problem(code):
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None  # reported as the run's exception
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute) and node.attr in BLOCKED_ATTRIBUTES:
+            return f"Restricted code may not access .{node.attr}"
+        if isinstance(node, ast.Name) and node.id.startswith("__") and node.id != "__name__":
+            return f"Restricted code may not use {node.id}"
+    return None
+
+
+def _peak_alloc_kb(code, restricted):
+    scope = _scope(restricted)
+    try:
+        compiled = compile(code, "<sandbox>", "exec")  # outside the trace, like the timed run's setup
+    except BaseException:
+        return None
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            exec(compiled, scope)
+    except MemoryError:
+        return None
+    except BaseException:
+        pass
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak // 1024
+
+
+_ADDRESS = re.compile(r" at 0x[0-9a-fA-F]+")
+
+
+def _globals_digest(scope):
+    # Data only: functions, classes and modules differ by identity, not by value
+    digests = {}
+    for name, value in scope.items():
+        if name.startswith("__") or callable(value) or isinstance(value, types.ModuleType):
+            continue
+        try:
+            text = _ADDRESS.sub("", repr(value))
+        except Exception:
+            continue
+        digests[name] = hashlib.sha256(text.encode(errors="replace")).hexdigest()[:16]
+    return digests
+
+
+def _reset_peak_rss():
+    # Linux only: resets VmHWM so the peak belongs to this run, not the worker's past
+    with contextlib.suppress(OSError):
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+
+
+def _peak_rss_kb():
+    with contextlib.suppress(OSError):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == "darwin" else peak  # bytes on macOS
+    return None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Shared pool, started on first use and shut down at exit."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(workers=int(os.environ.get("GREENCODE_SANDBOX_WORKERS", "2")))
+            atexit.register(_pool.close)
+        return _pool
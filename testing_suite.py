@@ -1,57 +1,157 @@
+import argparse
 import csv
-import time
-from green_analyzer import GreenAnalyzerPro
+import json
+import sys
 
-# 20 Examples of "Bad Code" to measure
+from benchmark import Timer, compare, environment, scratch_dir, speedup, summarize
+from backend.engine.trends import TrendStore
+from green_analyzer import get_analyzer
+from sandbox import get_pool
+
+# 20 examples of "bad code", each paired with its green fix. setup runs untimed before every sample.
 examples = [
-    {"id": "gen_exp", "code": "total = sum([i*i for i in range(10000)])"},
-    {"id": "str_concat", "code": 's = ""\nfor i in range(1000): s += "a"'},
-    {"id": "set_lookup", "code": "data = list(range(10000))\nif 9999 in data: pass"},
-    {"id": "file_stream", "code": "with open('test.txt', 'w') as f: f.write('lines\\n'*5000)\ndata = open('test.txt').read()"},
-    {"id": "nested_loops", "code": "A = range(200); B = range(200)\nfor x in A:\n for y in B: pass"},
-    {"id": "busy_wait", "code": "import time\nt_end = time.time() + 0.01\nwhile time.time() < t_end: pass"},
-    {"id": "map_filter", "code": "res = map(lambda x: x*2, range(10000))"},
-    {"id": "global_vars", "code": "x = 0\ndef inc():\n global x; x+=1\nfor _ in range(10000): inc()"},
-    {"id": "pandas_iter", "code": "import pandas as pd\ndf = pd.DataFrame({'a': range(1000)})\nfor i, row in df.iterrows(): pass"},
-    {"id": "len_cache", "code": "arr = range(10000)\ni=0\nwhile i < len(arr): i+=1"},
-    {"id": "enumerate_opt", "code": "arr = range(10000)\nfor i in range(len(arr)): val = arr[i]"},
-    {"id": "dict_keys", "code": "d = {i:i for i in range(10000)}\nfor k in d.keys(): pass"},
-    {"id": "huge_str_io", "code": "large = ''\nfor i in range(1000): large += str(i)"},
-    {"id": "tuple_swap", "code": "a=1; b=2\nfor _ in range(10000): temp=a; a=b; b=temp"},
-    {"id": "import_loop", "code": "for _ in range(1000): import math"},
-    {"id": "while_one", "code": "i=0\nwhile 1:\n if i>10000: break\n i+=1"},
-    {"id": "list_extend", "code": "l = []\nfor i in range(10000): l.append(i)"},
-    {"id": "try_loop", "code": "for i in range(10000):\n try: x=1\n except: pass"},
-    {"id": "math_pow", "code": "for i in range(10000): x = i ** 2"},
-    {"id": "manual_gc", "code": "import gc\nfor _ in range(100): gc.disable()"}
+    {"id": "gen_exp", "dirty": "total = sum([i*i for i in range(10000)])", "green": "total = sum(i*i for i in range(10000))"},
+    {"id": "str_concat", "dirty": 's = ""\nfor i in range(1000): s += "a"', "green": 's = "".join(["a" for i in range(1000)])'},
+    {"id": "set_lookup", "setup": "data = list(range(10000))\nlookup = set(data)", "dirty": "if 9999 in data: pass", "green": "if 9999 in lookup: pass"},
+    {"id": "file_stream", "setup": "with open('test.txt', 'w') as f: f.write('lines\\n'*5000)", "dirty": "data = open('test.txt').read()", "green": "with open('test.txt') as f:\n for line in f: pass"},
+    {"id": "nested_loops", "dirty": "A = range(200); B = range(200)\nfor x in A:\n for y in B: pass", "green": "from itertools import product\nfor x, y in product(range(200), range(200)): pass"},
+    {"id": "busy_wait", "dirty": "import time\nt_end = time.time() + 0.01\nwhile time.time() < t_end: pass", "green": "import time\ntime.sleep(0.01)"},
+    {"id": "map_filter", "dirty": "res = list(map(lambda x: x*2, range(10000)))", "green": "res = [x*2 for x in range(10000)]"},
+    {"id": "global_vars", "dirty": "x = 0\ndef inc():\n global x; x+=1\nfor _ in range(10000): inc()", "green": "def inc(x):\n return x + 1\nx = 0\nfor _ in range(10000): x = inc(x)"},
+    {"id": "pandas_iter", "setup": "import pandas as pd\ndf = pd.DataFrame({'a': range(1000)})", "dirty": "for i, row in df.iterrows(): pass", "green": "for row in df.itertuples(): pass"},
+    {"id": "len_cache", "dirty": "arr = range(10000)\ni=0\nwhile i < len(arr): i+=1", "green": "arr = range(10000)\nn = len(arr)\ni=0\nwhile i < n: i+=1"},
+    {"id": "enumerate_opt", "dirty": "arr = range(10000)\nfor i in range(len(arr)): val = arr[i]", "green": "arr = range(10000)\nfor i, val in enumerate(arr): pass"},
+    {"id": "dict_keys", "setup": "d = {i:i for i in range(10000)}", "dirty": "for k in d.keys(): pass", "green": "for k in d: pass"},
+    {"id": "huge_str_io", "dirty": "large = ''\nfor i in range(1000): large += str(i)", "green": "import io\nbuf = io.StringIO()\nfor i in range(1000): buf.write(str(i))\nlarge = buf.getvalue()"},
+    {"id": "tuple_swap", "dirty": "a=1; b=2\nfor _ in range(10000): temp=a; a=b; b=temp", "green": "a=1; b=2\nfor _ in range(10000): a, b = b, a"},
+    {"id": "import_loop", "dirty": "for _ in range(1000): import math", "green": "import math\nfor _ in range(1000): pass"},
+    {"id": "while_one", "dirty": "i=0\nwhile 1:\n if i>10000: break\n i+=1", "green": "i=0\nwhile True:\n if i>10000: break\n i+=1"},
+    {"id": "list_extend", "dirty": "l = []\nfor i in range(10000): l.append(i)", "green": "l = []\nl.extend(range(10000))"},
+    {"id": "try_loop", "dirty": "for i in range(10000):\n try: x=1\n except: pass", "green": "try:\n for i in range(10000): x=1\nexcept: pass"},
+    {"id": "math_pow", "dirty": "for i in range(10000): x = i ** 2", "green": "for i in range(10000): x = i * i"},
+    {"id": "manual_gc", "dirty": "import gc\nfor _ in range(100): gc.disable()", "green": "import gc\ngc.disable()"},
+]
+
+FIELDS = [
+    "Example_ID", "Dirty_Median_ns", "Dirty_IQR_ns", "Dirty_CI_Low_ns", "Dirty_CI_High_ns", "Dirty_CPU_Median_ns",
+    "Green_Median_ns", "Green_IQR_ns", "Green_CI_Low_ns", "Green_CI_High_ns", "Green_CPU_Median_ns",
+    "Speedup", "Speedup_CI_Low", "Speedup_CI_High",
+    "Dirty_Peak_Alloc_KB", "Green_Peak_Alloc_KB", "Dirty_Peak_RSS_KB", "Green_Peak_RSS_KB", "Green_Code_Fix",
 ]
 
-analyzer = GreenAnalyzerPro()
-csv_file = "green_code_metrics.csv"
-
-# Pre-create test file for the file_stream test if needed or let the code handle it
-# The code: with open('test.txt', 'w') as f: f.write('lines\n'*5000) handles it.
-
-print("--- Starting Green Benchmarks ---")
-with open(csv_file, mode='w', newline='', encoding='utf-8') as f:
-    writer = csv.DictWriter(f, fieldnames=["Example_ID", "Duration_sec", "Emissions_kg", "Green_Code_Fix"])
-    writer.writeheader()
-    for ex in examples:
-        print(f"Testing {ex['id']}...")
-        
-        # Prepare execution wrapper
-        def target_func():
-            exec_globals = {}
-            exec(ex["code"], exec_globals)
-            
-        metrics = analyzer.measure_efficiency(target_func)
-        fix = analyzer.analyze_and_fix(ex["code"])
-        
-        writer.writerow({
-            "Example_ID": ex["id"],
-            "Duration_sec": metrics.get("duration_sec", "N/A"),
-            "Emissions_kg": metrics.get("emissions_kg", 0),
-            "Green_Code_Fix": fix[0]["green_code"] if fix else "N/A"
-        })
-
-print(f"✅ Success! Send me the file: {csv_file}")
+
+def measure(code, setup, args):
+    timer = Timer(code, setup, repeat=args.repeat, warmup=args.warmup, min_time=args.min_time)
+    try:
+        samples = timer.run()
+        peak_alloc = timer.peak_allocation()
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}, None
+    # RSS needs a process of its own; the sandbox worker's high-water mark includes setup
+    sandboxed = get_pool().run(setup + "\n" + code, timeout_sec=30)
+    return {
+        "number": samples["number"],
+        "wall_ns": summarize(samples["wall_ns"]),
+        "cpu_ns": summarize(samples["cpu_ns"]),
+        "peak_alloc_kb": round(peak_alloc / 1024, 1),
+        "peak_rss_kb": sandboxed.get("peak_rss_kb"),
+    }, samples["wall_ns"]
+
+
+def run_suite(args):
+    analyzer = get_analyzer()
+    results = []
+    with scratch_dir():  # file_stream writes test.txt
+        for ex in examples:
+            if args.only and ex["id"] not in args.only:
+                continue
+            print(f"Testing {ex['id']}...", file=sys.stderr)
+            setup = ex.get("setup", "")
+            dirty, dirty_samples = measure(ex["dirty"], setup, args)
+            green, green_samples = measure(ex["green"], setup, args)
+            fix = analyzer.analyze_and_fix(setup + "\n" + ex["dirty"])
+            result = {"id": ex["id"], "dirty": dirty, "green": green, "green_code_fix": fix[0]["green_code"] if fix else None}
+            if dirty_samples and green_samples:
+                result["speedup"] = speedup(dirty_samples, green_samples)
+            results.append(result)
+    settings = {"repeat": args.repeat, "warmup": args.warmup, "min_time": args.min_time}
+    return {"environment": environment(), "settings": settings, "results": results}
+
+
+def write_csv(report, path):
+    with open(path, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for r in report["results"]:
+            row = {"Example_ID": r["id"], "Green_Code_Fix": r["green_code_fix"] or "N/A"}
+            for variant in ("dirty", "green"):
+                prefix = variant.capitalize()
+                stats = r[variant]
+                if "error" in stats:
+                    row[f"{prefix}_Median_ns"] = stats["error"]
+                    continue
+                row[f"{prefix}_Median_ns"] = round(stats["wall_ns"]["median"], 1)
+                row[f"{prefix}_IQR_ns"] = round(stats["wall_ns"]["iqr"], 1)
+                row[f"{prefix}_CI_Low_ns"] = round(stats["wall_ns"]["ci_low"], 1)
+                row[f"{prefix}_CI_High_ns"] = round(stats["wall_ns"]["ci_high"], 1)
+                row[f"{prefix}_CPU_Median_ns"] = round(stats["cpu_ns"]["median"], 1)
+                row[f"{prefix}_Peak_Alloc_KB"] = stats.get("peak_alloc_kb")
+                row[f"{prefix}_Peak_RSS_KB"] = stats.get("peak_rss_kb")
+            if "speedup" in r:
+                row["Speedup"] = round(r["speedup"]["ratio"], 3)
+                row["Speedup_CI_Low"] = round(r["speedup"]["ci_low"], 3)
+                row["Speedup_CI_High"] = round(r["speedup"]["ci_high"], 3)
+            writer.writerow(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Paired dirty/green micro-benchmarks.")
+    parser.add_argument("--repeat", type=int, default=25, help="timed samples per snippet")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed samples before measuring")
+    parser.add_argument("--min-time", type=float, default=0.02, help="seconds each sample should last")
+    parser.add_argument("--only", nargs="+", help="example ids to run")
+    parser.add_argument("--json", default="green_code_metrics.json")
+    parser.add_argument("--csv", default="green_code_metrics.csv")
+    parser.add_argument("--compare", metavar="BASE_JSON", help="flag regressions against an earlier run")
+    parser.add_argument("--head", metavar="HEAD_JSON", help="with --compare, use this run instead of a fresh one")
+    parser.add_argument("--threshold", type=float, default=0.05, help="median slowdown that counts as a regression")
+    parser.add_argument("--history", metavar="DB", help="also append the run to this trend store (SQLite)")
+    args = parser.parse_args(argv)
+
+    if args.head:
+        with open(args.head, encoding="utf-8") as f:
+            report = json.load(f)
+    else:
+        print("--- Starting Green Benchmarks ---", file=sys.stderr)
+        report = run_suite(args)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        write_csv(report, args.csv)
+        if args.history:
+            store = TrendStore(args.history)
+            store.record_benchmark(report)
+            store.close()
+        for r in report["results"]:
+            if "speedup" in r:
+                s = r["speedup"]
+                print(f"{r['id']:<15} {r['dirty']['wall_ns']['median']:>14.0f} ns -> {r['green']['wall_ns']['median']:>12.0f} ns"
+                      f"  {s['ratio']:6.2f}x [{s['ci_low']:.2f}, {s['ci_high']:.2f}]"
+                      f"  alloc {r['dirty']['peak_alloc_kb']:.1f} -> {r['green']['peak_alloc_kb']:.1f} KB")
+            else:
+                print(f"{r['id']:<15} {r['dirty'].get('error') or r['green'].get('error')}")
+        print(f"Results written to {args.json} and {args.csv}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+        regressions = compare(base, report, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['id']} ({r['variant']}): {r['base_median_ns']:.0f} ns -> {r['head_median_ns']:.0f} ns (+{r['change']:.1%})")
+        if regressions:
+            return 1
+        print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())